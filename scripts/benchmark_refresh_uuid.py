@@ -0,0 +1,32 @@
+"""
+测量粘贴节点时刷新uuid的耗时
+在项目根目录运行：python scripts/benchmark_refresh_uuid.py
+"""
+
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, (Path(__file__).parent.parent / "src").as_posix())
+
+from project_graph.node_manager import NodeManager  # noqa: E402
+
+
+def main():
+    for node_count in (1000, 10000, 100000):
+        test_data = {
+            "nodes": [
+                {
+                    "uuid": str(i),
+                    "children": [str((i + 1) % node_count), str(i * 7 % node_count)],
+                }
+                for i in range(node_count)
+            ]
+        }
+        start_time = perf_counter()
+        NodeManager._refresh_all_uuid(test_data)
+        print(f"刷新 {node_count} 个节点的uuid: {perf_counter() - start_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
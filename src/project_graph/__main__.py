@@ -4,13 +4,15 @@ import platform
 import shutil
 import subprocess
 import sys
+import time
 import traceback
 from pathlib import Path
 from types import TracebackType
 
 import PyQt5
-from PyQt5.QtCore import Qt, QTimer, QUrl
+from PyQt5.QtCore import QEvent, QRect, QRectF, Qt, QTimer, QUrl
 from PyQt5.QtGui import (
+    QCloseEvent,
     QColor,
     QDesktopServices,
     QIcon,
@@ -18,6 +20,7 @@ from PyQt5.QtGui import (
     QMouseEvent,
     QPainter,
     QPaintEvent,
+    QPixmap,
     QWheelEvent,
 )
 from PyQt5.QtWidgets import (
@@ -57,6 +60,7 @@ from project_graph.paint.paint_elements import paint_details_data, paint_grid
 from project_graph.paint.paint_utils import PainterUtils
 from project_graph.paint.paintables import PaintContext
 from project_graph.paint.painters import ProjectGraphPainter
+from project_graph.paint.tile_renderer import TileRenderer
 from project_graph.recent_file_manager import RecentFileManager
 from project_graph.settings.setting_service import SETTING_SERVICE
 from project_graph.toolbar.toolbar import Toolbar
@@ -98,6 +102,35 @@ if platform.system() == "Linux":
 
 
 class Canvas(QMainWindow):
+    TICK_INTERVAL = 16
+    """窗口在前台时的帧间隔，毫秒，1000/60 大约= 16ms"""
+    INACTIVE_TICK_INTERVAL = 250
+    """窗口不在前台时的帧间隔，毫秒，只用来让相机惯性和特效慢慢播完"""
+
+    REPAINT_EVENT_TYPES = {
+        QEvent.Type.MouseButtonPress,
+        QEvent.Type.MouseButtonRelease,
+        QEvent.Type.MouseButtonDblClick,
+        QEvent.Type.MouseMove,
+        QEvent.Type.Wheel,
+        QEvent.Type.KeyPress,
+        QEvent.Type.KeyRelease,
+        QEvent.Type.DragEnter,
+        QEvent.Type.DragMove,
+        QEvent.Type.DragLeave,
+        QEvent.Type.Drop,
+    }
+    """这些输入事件处理完之后画面可能变了，需要重绘"""
+
+    DIRTY_VIEW_MARGIN = 12
+    """局部重绘时屏幕上额外向外多重绘的宽度，像素，用来盖住线宽和抗锯齿"""
+
+    CAMERA_SETTLE_TIME = 0.15
+    """
+    相机停下来多久之后才按完整精度重画场景，秒
+    中键拖动时两次鼠标事件之间相机是不动的，不能一停就重画
+    """
+
     def __init__(self):
         super().__init__()
         self.init_ui()
@@ -107,10 +140,10 @@ class Canvas(QMainWindow):
         # 设置鼠标追踪，否则无法捕捉鼠标移动事件，只有按下才能捕捉到了
         self.setMouseTracking(True)
 
-        # 创建一个定时器用于定期更新窗口
+        # 创建一个定时器用于推进动画，画面只在有变化的时候才重绘
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.tick)
-        self.timer.setInterval(16)  # 1000/60 大约= 16ms
+        self.timer.setInterval(self.TICK_INTERVAL)
         # 启动定时器
         self.timer.start()
 
@@ -118,10 +151,12 @@ class Canvas(QMainWindow):
         self.camera = Camera(NumberVector.zero(), 1920, 1080)
         self.effect_manager = EffectManager()
         self.node_manager = NodeManager()
+        self.tile_renderer = TileRenderer()
         self.recent_file_manager = RecentFileManager()
         self.toolbar: Toolbar = Toolbar()
 
         self.init_toolbar()
+        self.node_manager.add_selection_listener(self._on_selection_changed)
 
         # ====== 鼠标事件相关
         self.is_pressing = False
@@ -150,6 +185,40 @@ class Canvas(QMainWindow):
         self.warning_nodes: list[EntityNode] = []
         """准备要删除的节点"""
 
+        # ====== 悬停相关
+        self.detail_show_nodes: list[EntityNode] = []
+        """当前鼠标悬停着、正在显示详细信息的节点"""
+
+        # ====== 场景图层缓存
+        self._scene_layer: QPixmap | None = None
+        """
+        画好的场景（背景、网格、节点、连线），和窗口一样大
+        没有平移缩放的时候，每次重绘只需要贴这张图，再把选中框等叠加层画在上面
+        """
+        self._scene_layer_camera_state = self._get_camera_state()
+        """画场景图层时的相机状态"""
+        self._scene_layer_key: tuple | None = None
+        """
+        画场景图层时的 (相机和显示设置, 场景版本号)，变了就要重画
+        None表示必须整张重画
+        """
+        self._scene_layer_dirty_rects: list[QRectF] = []
+        """场景图层上已经过期、下次绘制前要重画的屏幕区域"""
+        self._is_scene_layer_preview = False
+        """
+        场景图层是不是相机移动中的预览
+        预览是用后台画的图块金字塔拉伸拼出来的，相机停下来以后要按完整精度重画
+        """
+        self._settled_scene_layer: tuple[QPixmap, tuple[float, float, float]] | None = (
+            None
+        )
+        """相机开始移动前最后一张完整精度的场景图层和当时的相机状态，预览时垫在最底下"""
+        self._scene_paint_time = 0.0
+        """上一次完整精度地整张画场景图层花的时间，秒，超过一帧的话相机移动时就改用预览"""
+        self._last_camera_state = self._get_camera_state()
+        self._camera_moved_time = 0.0
+        """相机最后一次移动或缩放的时间"""
+
         # ====== 框选相关
         self.is_selecting = False
         """是否正在框选"""
@@ -257,14 +326,37 @@ class Canvas(QMainWindow):
         )
         pass
 
+    def _on_selection_changed(self, nodes: list[EntityNode]):
+        """选中状态变了的节点要重画选中框，合成一块区域重绘，选中大量节点时不会拆成太多小块"""
+        self._repaint_world_rects(
+            [
+                Rectangle.from_edges(
+                    min(node.body_shape.left() for node in nodes),
+                    min(node.body_shape.top() for node in nodes),
+                    max(node.body_shape.right() for node in nodes),
+                    max(node.body_shape.bottom() for node in nodes),
+                ).expand(NodeManager.PAINT_CULL_MARGIN)
+            ]
+        )
+
     def _delete_current_select_node(self):
         """删除当前选中的节点"""
         log("删除当前选中的节点")
-        self.node_manager.delete_nodes(
-            [node for node in self.node_manager.nodes if node.is_selected]
-        )
+        self._delete_nodes(list(self.node_manager.selected_nodes))
+        self.update()
         pass
 
+    def _delete_nodes(self, nodes: list[EntityNode]):
+        """删除节点，被删的节点正在显示的详细文字也不再画了"""
+        deleted_nodes = set(nodes)
+        for node in self.detail_show_nodes:
+            if node in deleted_nodes:
+                node.is_detail_show = False
+        self.detail_show_nodes = [
+            node for node in self.detail_show_nodes if node not in deleted_nodes
+        ]
+        self.node_manager.delete_nodes(nodes)
+
     def open_cache_folder(self):
         """打开缓存文件夹"""
         if platform.system() == "Windows":
@@ -311,7 +403,10 @@ class Canvas(QMainWindow):
         with open(file_path, "r", encoding="utf-8") as f:
             load_data = json.loads(f.read())
             self.node_manager.load_from_dict(load_data)
+            # 换了一个场景，旧的图块没有用了
+            self.tile_renderer.clear()
             self.recent_file_manager.add_recent_file(Path(file_path))
+        self.update()
 
     def on_open_file(self):
         # 选择json文件
@@ -360,6 +455,7 @@ class Canvas(QMainWindow):
 
         def on_change_line_style(index):
             SETTING_SERVICE.line_style = index
+            self.update()
 
         line_style_combo_box.currentIndexChanged.connect(on_change_line_style)
         layout.addWidget(line_style_combo_box)
@@ -373,6 +469,7 @@ class Canvas(QMainWindow):
 
         def on_change_theme_style(index):
             SETTING_SERVICE.theme_style = index
+            self.update()
 
         theme_style_combo_box.currentIndexChanged.connect(on_change_theme_style)
         layout.addWidget(theme_style_combo_box)
@@ -383,6 +480,7 @@ class Canvas(QMainWindow):
 
         def on_change_show_grid(state):
             SETTING_SERVICE.is_show_grid = state == 2
+            self.update()
 
         show_grid_check_box.stateChanged.connect(on_change_show_grid)
         layout.addWidget(show_grid_check_box)
@@ -393,6 +491,7 @@ class Canvas(QMainWindow):
 
         def on_change_show_debug_info(state):
             SETTING_SERVICE.is_show_debug_text = state == 2
+            self.update()
 
         show_debug_info_check_box.stateChanged.connect(on_change_show_debug_info)
         layout.addWidget(show_debug_info_check_box)
@@ -621,10 +720,178 @@ class Canvas(QMainWindow):
         self.setGeometry(int(new_left), int(new_top), int(new_width), int(new_height))
 
     def tick(self):
+        # 在推进之前判断，这样动画停下来的最后一帧也能画出来
+        is_camera_moving = self.camera.is_moving
+        was_effect_playing = self.effect_manager.is_playing
+        effect_rects = self.effect_manager.get_bounds_list()
         self.effect_manager.tick()
         self.camera.tick()
+        self._update_camera_motion()
+        # 后台画好的图块
+        finished_rects = self.tile_renderer.poll()
+        if self._is_tile_rendering() or self._is_scene_layer_preview:
+            finished_view_rects = self._world_rects_to_view(finished_rects)
+            self._scene_layer_dirty_rects.extend(finished_view_rects)
+            for view_rect in finished_view_rects:
+                self.update(view_rect.toAlignedRect())
+        if is_camera_moving:
+            self._repaint_all()
+        elif self._is_scene_layer_preview and not self._is_camera_settling():
+            # 相机停稳了，按完整精度重画
+            self._repaint_all()
+        elif was_effect_playing:
+            # 只有特效在动，只重绘特效前后所在的区域
+            new_effect_rects = self.effect_manager.get_bounds_list()
+            if effect_rects is None or new_effect_rects is None:
+                self._repaint_all()
+            else:
+                self._repaint_world_rects(effect_rects + new_effect_rects)
+
+    def event(self, a0: QEvent | None) -> bool:
+        assert a0 is not None
+        if a0.type() != QEvent.Type.MouseMove or SETTING_SERVICE.is_show_debug_text:
+            result = super().event(a0)
+            if a0.type() in self.REPAINT_EVENT_TYPES:
+                self._repaint_all()
+            return result
+        # 鼠标移动非常频繁，而且大多只影响一小块区域（悬停详情、拖动节点、框选框等），
+        # 所以只重绘变化前后的区域
+        camera_state = self._get_camera_state()
+        overlay_rects = self._get_overlay_rects()
+        result = super().event(a0)
+        if self._get_camera_state() != camera_state:
+            self._repaint_all()
+        else:
+            self._repaint_world_rects(overlay_rects + self._get_overlay_rects())
+        return result
+
+    def _get_camera_state(self) -> tuple[float, float, float]:
+        return (
+            self.camera.location.x,
+            self.camera.location.y,
+            self.camera.current_scale,
+        )
+
+    def _update_camera_motion(self):
+        """记录相机最后一次移动的时间"""
+        camera_state = self._get_camera_state()
+        if camera_state != self._last_camera_state:
+            self._last_camera_state = camera_state
+            self._camera_moved_time = time.perf_counter()
+
+    def _is_camera_settling(self) -> bool:
+        """相机正在移动，或者刚停下来不久"""
+        return (
+            self.camera.is_moving
+            or time.perf_counter() - self._camera_moved_time < self.CAMERA_SETTLE_TIME
+        )
+
+    def _get_overlay_rects(self) -> list[Rectangle]:
+        """叠加在场景上、随鼠标变化的东西所在的范围，世界坐标"""
+        rects: list[Rectangle] = []
+        if self.is_selecting and self.select_rectangle is not None:
+            # 框进框出的节点由选中状态变化的回调负责重绘
+            rects.append(self.select_rectangle)
+        if self.is_cutting:
+            rects.append(
+                Rectangle.from_points(
+                    [self.mouse_right_start_location, self.mouse_right_location]
+                )
+            )
+        if self.connect_from_nodes:
+            # 连线可能吸附到鼠标下的节点上
+            points = [node.body_shape.center for node in self.connect_from_nodes]
+            points.append(self.mouse_right_location)
+            points.extend(
+                node.body_shape.center
+                for node in self.node_manager.nodes_at_point(self.mouse_right_location)
+            )
+            rects.append(Rectangle.from_points(points))
+        for line, _, _ in self.warning_lines:
+            rects.append(Rectangle.from_points([line.start, line.end]))
+        for node in self.warning_nodes:
+            rects.append(node.body_shape)
+        for node in self.detail_show_nodes:
+            rects.append(node.body_shape)
+            rects.append(node.get_details_rect(self.camera.current_scale))
+        return [rect.expand(NodeManager.PAINT_CULL_MARGIN) for rect in rects]
+
+    def _repaint_all(self):
+        # 整个画面都要重绘，场景图层过期的区域还是要记下来
+        self._take_scene_damage()
         self.update()
 
+    def _repaint_world_rects(self, rects: list[Rectangle]):
+        """
+        只重绘这些世界坐标范围，节点发生变化的区域也会一起重绘
+        """
+        damaged_view_rects = self._take_scene_damage()
+        if damaged_view_rects is None:
+            self.update()
+            return
+        for view_rect in self._world_rects_to_view(rects) + damaged_view_rects:
+            self.update(view_rect.toAlignedRect())
+
+    def _take_scene_damage(self) -> list[QRectF] | None:
+        """
+        取走节点管理器记录的变化区域，标记场景图层上这些地方过期了
+        :return: 变化区域的屏幕坐标，None表示变化太多，整个画面都要重绘
+        """
+        damaged_rects = self.node_manager.take_damaged_rects()
+        if damaged_rects is None:
+            self._scene_layer_key = None
+            self.tile_renderer.damage_all()
+            return None
+        self.tile_renderer.damage(damaged_rects)
+        view_rects = self._world_rects_to_view(damaged_rects)
+        self._scene_layer_dirty_rects.extend(view_rects)
+        return view_rects
+
+    def _world_rects_to_view(self, rects: list[Rectangle]) -> list[QRectF]:
+        """世界坐标范围转换成窗口内的屏幕范围，多扩一圈盖住线宽，完全在窗口外的丢掉"""
+        scale = self.camera.current_scale
+        margin = self.DIRTY_VIEW_MARGIN
+        window_rect = QRectF(self.rect())
+        view_rects = []
+        for rect in rects:
+            left_top = self.camera.location_world2view(rect.location_left_top)
+            view_rect = QRectF(
+                left_top.x - margin,
+                left_top.y - margin,
+                rect.width * scale + margin * 2,
+                rect.height * scale + margin * 2,
+            ).intersected(window_rect)
+            if not view_rect.isEmpty():
+                view_rects.append(view_rect)
+        return view_rects
+
+    def _view_rect_to_world(self, view_rect: QRect) -> Rectangle:
+        return Rectangle(
+            self.camera.location_view2world(
+                NumberVector(view_rect.left(), view_rect.top())
+            ),
+            view_rect.width() / self.camera.current_scale,
+            view_rect.height() / self.camera.current_scale,
+        )
+
+    def changeEvent(self, a0: QEvent | None):
+        assert a0 is not None
+        if a0.type() == QEvent.Type.ActivationChange:
+            # 窗口不在前台时降低帧率，避免后台空转占用CPU
+            self.timer.setInterval(
+                self.TICK_INTERVAL
+                if self.isActiveWindow()
+                else self.INACTIVE_TICK_INTERVAL
+            )
+            # 不在前台时要画半透明遮罩
+            self.update()
+        super().changeEvent(a0)
+
+    def closeEvent(self, a0: QCloseEvent | None):
+        # 后台画图块的线程不再需要了，还在排队的图块直接取消，不拖慢退出
+        self.tile_renderer.shutdown()
+        super().closeEvent(a0)
+
     # region 鼠标事件
 
     def mousePressEvent(self, a0: QMouseEvent | None):
@@ -653,20 +920,10 @@ class Canvas(QMainWindow):
 
             # 更新被选中的节点，如果没有选中节点就开始框选
 
-            is_have_selected_node = any(
-                node.is_selected for node in self.node_manager.nodes
-            )
-            is_click_on_node = any(
-                node.body_shape.is_contain_point(point_world_location)
-                for node in self.node_manager.nodes
-            )
-
+            is_have_selected_node = len(self.node_manager.selected_nodes) > 0
             # 获取点击的节点
-            click_node = None
-            for node in self.node_manager.nodes:
-                if node.body_shape.is_contain_point(point_world_location):
-                    click_node = node
-                    break
+            click_node = self.node_manager.get_node_by_location(point_world_location)
+            is_click_on_node = click_node is not None
 
             if is_click_on_node:
                 assert click_node is not None
@@ -677,21 +934,19 @@ class Canvas(QMainWindow):
                         pass
                     else:
                         # 取消选择所有节点
-                        for node in self.node_manager.nodes:
-                            node.is_selected = False
+                        self.node_manager.clear_selection()
                         # 单击选择
-                        click_node.is_selected = True
+                        self.node_manager.select_nodes([click_node])
                 else:
                     # D
-                    click_node.is_selected = True
+                    self.node_manager.select_nodes([click_node])
             else:
                 # A B
                 self.is_selecting = True
                 self.select_start_location = point_world_location.clone()
                 self.select_rectangle = None
                 # 取消选择所有节点
-                for node in self.node_manager.nodes:
-                    node.is_selected = False
+                self.node_manager.clear_selection()
                 pass
 
             # 为移动做准备
@@ -705,24 +960,14 @@ class Canvas(QMainWindow):
             self.mouse_right_start_location = point_world_location.clone()
             # 开始连线
             self.is_cutting = True
-            is_click_on_node = any(
-                node.body_shape.is_contain_point(point_world_location)
-                for node in self.node_manager.nodes
-            )
-
-            click_node = None
-            for node in self.node_manager.nodes:
-                if node.body_shape.is_contain_point(point_world_location):
-                    click_node = node
-                    break
+            click_node = self.node_manager.get_node_by_location(point_world_location)
+            is_click_on_node = click_node is not None
 
             if is_click_on_node:
                 assert click_node is not None
 
                 self.is_cutting = False
-                self.connect_from_nodes = [
-                    node for node in self.node_manager.nodes if node.is_selected
-                ]
+                self.connect_from_nodes = list(self.node_manager.selected_nodes)
                 if click_node not in self.connect_from_nodes:
                     # 如果 右键的节点 没有在被选中的节点中，则不触发多重连接
                     self.connect_from_nodes = [click_node]
@@ -731,12 +976,11 @@ class Canvas(QMainWindow):
                     )
                 else:
                     # 如果在被选中的节点中，则触发多重连接
-                    for node in self.node_manager.nodes:
+                    for node in self.connect_from_nodes:
                         # 加特效
-                        if node.is_selected:
-                            self.effect_manager.add_effect(
-                                EffectRectangleFlash(15, node.body_shape.clone())
-                            )
+                        self.effect_manager.add_effect(
+                            EffectRectangleFlash(15, node.body_shape.clone())
+                        )
             else:
                 self.is_cutting = True
                 self.connect_from_nodes = []
@@ -760,30 +1004,32 @@ class Canvas(QMainWindow):
                 if self.is_selecting:
                     # 框选
                     # HACK: 踩坑 location作为引用传递，导致修改了原来的对象被修改！
-                    self.select_rectangle = Rectangle(
-                        self.select_start_location.clone(),
-                        mouse_world_location.x - self.select_start_location.x,
-                        mouse_world_location.y - self.select_start_location.y,
-                    )
-                    # 找到在框选范围内的所有节点
-                    for node in self.node_manager.nodes:
-                        node.is_selected = node.body_shape.is_collision(
-                            self.select_rectangle
+                    self._update_select_rectangle(
+                        Rectangle(
+                            self.select_start_location.clone(),
+                            mouse_world_location.x - self.select_start_location.x,
+                            mouse_world_location.y - self.select_start_location.y,
                         )
+                    )
                 else:
                     # 移动
 
                     # 当前帧距离上一帧的 鼠标移动向量
                     mouse_d_location = mouse_world_location - self.last_move_location
-                    for node in self.node_manager.nodes:
-                        if node.is_selected:
-                            if Qt.Key.Key_Control in self.pressing_keys:
-                                # 按住Ctrl，移动节点，带动子节点一起移动
-                                self.node_manager.move_node_with_children(
-                                    node, mouse_d_location
-                                )
-                            else:
-                                self.node_manager.move_node(node, mouse_d_location)
+                    if Qt.Key.Key_Control in self.pressing_keys:
+                        # 按住Ctrl，移动节点，带动子节点一起移动
+                        # 几个选中节点共同的子孙节点也只移动一次
+                        self.node_manager.move_nodes(
+                            self.node_manager.get_subtree_nodes(
+                                self.node_manager.selected_nodes
+                            ),
+                            mouse_d_location,
+                        )
+                    else:
+                        # 选中的节点整体移动
+                        self.node_manager.move_nodes(
+                            self.node_manager.selected_nodes, mouse_d_location
+                        )
 
                 self.last_move_location = mouse_world_location.clone()
 
@@ -795,29 +1041,22 @@ class Canvas(QMainWindow):
                     cutting_line = Line(
                         self.mouse_right_start_location, self.mouse_right_location
                     )
-                    # 查看切割线是否和其他连线相交
-                    for (
-                        line,
-                        start_node,
-                        end_node,
-                    ) in self.node_manager.get_all_lines_and_node():
-                        if line.is_intersecting(cutting_line):
-                            # 准备要切断这个线，先进行标注
-                            self.warning_lines.append((line, start_node, end_node))
-                            pass
-                    # 查看切割线是否和其他节点相交
-                    for node in self.node_manager.nodes:
+                    # 和切割线相交的连线准备要切断，先进行标注
+                    self.warning_lines.extend(
+                        self.node_manager.lines_intersecting(cutting_line)
+                    )
+                    # 和切割线相交的节点准备要删除，先进行标注
+                    for node in self.node_manager.nodes_intersecting(cutting_line):
                         if node == self.connect_from_nodes:
                             continue
-                        if node.body_shape.is_intersect_with_line(cutting_line):
-                            # 准备要切断这个节点，先进行标注
-                            self.warning_nodes.append(node)
+                        self.warning_nodes.append(node)
                 else:
                     # 如果是右键，开始连线
-                    for node in self.node_manager.nodes:
-                        if node.body_shape.is_contain_point(mouse_world_location):
-                            self.connect_to_node = node
-                            break
+                    hover_node = self.node_manager.get_node_by_location(
+                        mouse_world_location
+                    )
+                    if hover_node is not None:
+                        self.connect_to_node = hover_node
             elif a0.buttons() == Qt.MouseButton.MiddleButton:
                 # 移动的时候，应该记录与上一次鼠标位置的相差距离向量
                 current_mouse_move_location = self.camera.location_view2world(
@@ -829,11 +1068,38 @@ class Canvas(QMainWindow):
                 self.camera.location -= diff_location
         else:
             # 鼠标放在哪个节点上，就显示哪个节点的详细信息
-            for node in self.node_manager.nodes:
-                if node.body_shape.is_contain_point(mouse_world_location):
-                    node.is_detail_show = True
-                else:
-                    node.is_detail_show = False
+            hover_nodes = self.node_manager.nodes_at_point(mouse_world_location)
+            for node in self.detail_show_nodes:
+                node.is_detail_show = False
+            for node in hover_nodes:
+                node.is_detail_show = True
+            self.detail_show_nodes = hover_nodes
+
+    def _update_select_rectangle(self, select_rectangle: Rectangle):
+        """
+        更新框选框，同时更新框选到的节点
+        只有新旧两个框不重叠的部分里的节点选中状态可能会变，所以只查这部分，
+        拖动框选框的开销和框边扫过的范围成正比，和框里、框外有多少节点无关
+        """
+        old_rectangle = self.select_rectangle
+        self.select_rectangle = select_rectangle
+        if old_rectangle is None:
+            # 刚开始框选，按下鼠标的时候已经取消选择所有节点了
+            changed_rects = [select_rectangle]
+        else:
+            changed_rects = old_rectangle.subtract(
+                select_rectangle
+            ) + select_rectangle.subtract(old_rectangle)
+        for rect in changed_rects:
+            nodes = self.node_manager.nodes_in_rect(rect)
+            self.node_manager.select_nodes(
+                node for node in nodes if node.body_shape.is_collision(select_rectangle)
+            )
+            self.node_manager.deselect_nodes(
+                node
+                for node in nodes
+                if not node.body_shape.is_collision(select_rectangle)
+            )
 
     def mouseReleaseEvent(self, a0: QMouseEvent | None):
         assert a0 is not None
@@ -847,9 +1113,7 @@ class Canvas(QMainWindow):
             # 是否需要显示toolbar（如果是在toolbar上弹起的，就不显示）
             if not self.toolbar.is_click_inside(mouse_view_location):
                 # 显示toolbar
-                self.toolbar.nodes = [
-                    node for node in self.node_manager.nodes if node.is_selected
-                ]
+                self.toolbar.nodes = list(self.node_manager.selected_nodes)
                 # 设定框的位置为鼠标释放位置并往右下角偏移一点点
                 self.toolbar.body_shape.location_left_top = (
                     mouse_view_location + NumberVector(20, 20)
@@ -886,8 +1150,8 @@ class Canvas(QMainWindow):
                     self.node_manager.disconnect_node(start_node, end_node)
                 self.warning_lines.clear()
                 # 删除所有准备删除的节点
+                self._delete_nodes(self.warning_nodes)
                 for node in self.warning_nodes:
-                    self.node_manager.delete_node(node)
                     # 加特效
                     self.effect_manager.add_effect(
                         EffectRectangleShrink(15, node.body_shape.clone())
@@ -911,11 +1175,7 @@ class Canvas(QMainWindow):
         click_location = self.camera.location_view2world(
             NumberVector(event.pos().x(), event.pos().y())
         )
-        select_node = None
-        for node in self.node_manager.nodes:
-            if node.body_shape.is_contain_point(click_location):
-                select_node = node
-                break
+        select_node = self.node_manager.get_node_by_location(click_location)
 
         if event.button() == Qt.MouseButton.LeftButton:
             if select_node is None:
@@ -942,29 +1202,23 @@ class Canvas(QMainWindow):
                         text=select_node.inner_text,
                     )
                     if ok:
-                        select_node.inner_text = text
-                        self.node_manager.update_lines()
+                        self.node_manager.edit_node_inner_text(select_node, text)
 
         elif event.button() == Qt.MouseButton.RightButton:
             if select_node is not None:
                 color = QColorDialog.getColor()  # 弹出颜色选择对话框
                 if color.isValid():  # 检查颜色是否有效
-                    select_node.color = color  # 假设节点有一个 color 属性来存储颜色
+                    self.node_manager.set_node_color(select_node, color)
             pass
 
     def wheelEvent(self, a0: QWheelEvent | None):
         assert a0 is not None
         delta = a0.angleDelta().y()
         # 如果鼠标当前是在一个节点上的，那么不缩放
-        is_mouse_hover_node = False
-        hover_node = None
         view_location = NumberVector(a0.pos().x(), a0.pos().y())
         world_location = self.camera.location_view2world(view_location)
-        for node in self.node_manager.nodes:
-            if node.body_shape.is_contain_point(world_location):
-                is_mouse_hover_node = True
-                hover_node = node
-                break
+        hover_node = self.node_manager.get_node_by_location(world_location)
+        is_mouse_hover_node = hover_node is not None
 
         if is_mouse_hover_node:
             # 旋转节点
@@ -1019,8 +1273,9 @@ class Canvas(QMainWindow):
                     text=self.node_manager.cursor_node.inner_text,
                 )
                 if ok:
-                    self.node_manager.cursor_node.inner_text = text
-                    self.node_manager.update_lines()
+                    self.node_manager.edit_node_inner_text(
+                        self.node_manager.cursor_node, text
+                    )
 
         elif key == Qt.Key.Key_Left:
             self.node_manager.move_cursor("left")
@@ -1073,11 +1328,22 @@ class Canvas(QMainWindow):
         rect = self.rect()
         # 更新camera大小，防止放大窗口后缩放中心点还在左上部分
         self.camera.reset_view_size(rect.width(), rect.height())
-        # 使用黑色填充整个窗口
-        painter.fillRect(rect, QColor(43, 43, 43, 255))
-        # 画网格
-        if SETTING_SERVICE.is_show_grid:
-            paint_grid(painter, self.camera)
+        # 局部重绘时只需要重绘这个范围
+        paint_rect = a0.rect()
+        clip_rect = None
+        if paint_rect != rect:
+            clip_rect = self._view_rect_to_world(paint_rect)
+        # 场景画在缓存的图层里，没变化的时候直接贴上去
+        painter.drawPixmap(0, 0, self._get_scene_layer())
+
+        # 上下文对象
+        paint_context = PaintContext(
+            ProjectGraphPainter(painter), self.camera, self.mouse_location
+        )
+        # 选中框、详细文字等
+        self.node_manager.paint_overlays(
+            paint_context, self.detail_show_nodes, clip_rect
+        )
         # 当前的切断线
         if self.is_cutting:
             PainterUtils.paint_solid_line(
@@ -1106,12 +1372,11 @@ class Canvas(QMainWindow):
         if self.connect_from_nodes and self.mouse_right_location is not None:
             # 如果鼠标位置是没有和任何节点相交的
             connect_target_node = None
-            for node in self.node_manager.nodes:
+            for node in self.node_manager.nodes_at_point(self.mouse_right_location):
                 if node in self.connect_from_nodes:
                     continue
-                if node.body_shape.is_contain_point(self.mouse_right_location):
-                    connect_target_node = node
-                    break
+                connect_target_node = node
+                break
             if connect_target_node:
                 # 像吸附住了一样画线
                 for node in self.connect_from_nodes:
@@ -1137,12 +1402,6 @@ class Canvas(QMainWindow):
                         30 * self.camera.current_scale,
                     )
 
-        # 上下文对象
-        paint_context = PaintContext(
-            ProjectGraphPainter(painter), self.camera, self.mouse_location
-        )
-
-        self.node_manager.paint(paint_context)
         # 所有要被切断的线
         for line, _, _ in self.warning_lines:
             PainterUtils.paint_solid_line(
@@ -1174,17 +1433,24 @@ class Canvas(QMainWindow):
                     f"当前缩放: {self.camera.current_scale:.2f}",
                     f"location: ({self.camera.location.x:.2f}, {self.camera.location.y:.2f})",
                     f"effect: {len(self.effect_manager.effects)}",
+                    f"节点: 绘制 {self.node_manager.painted_node_count}"
+                    f" 剔除 {self.node_manager.culled_node_count}",
+                    f"连线: 绘制 {self.node_manager.painted_line_count}"
+                    f" 剔除 {self.node_manager.culled_line_count}",
+                    f"图块: 缓存 {len(self.tile_renderer)}"
+                    f" 绘制中 {self.tile_renderer.pending_count}",
                 ],
             )
         # 工具栏
         self.toolbar.paint(paint_context)
         # 最终覆盖在屏幕上一层：拖拽情况
+        # 局部重绘时也按整个窗口来算位置，只是被裁剪到重绘范围里
         if self.is_dragging_file:
             PainterUtils.paint_rect(
                 painter,
                 NumberVector.zero(),
-                a0.rect().width(),
-                a0.rect().height(),
+                rect.width(),
+                rect.height(),
                 QColor(0, 0, 0, 128),
                 QColor(255, 255, 255, 0),
                 int(10 * self.camera.current_scale),
@@ -1196,7 +1462,7 @@ class Canvas(QMainWindow):
                     0, self.camera.location_world2view(self.dragging_file_location).y
                 ),
                 NumberVector(
-                    a0.rect().width(),
+                    rect.width(),
                     self.camera.location_world2view(self.dragging_file_location).y,
                 ),
                 QColor(148, 220, 254),
@@ -1209,7 +1475,7 @@ class Canvas(QMainWindow):
                 ),
                 NumberVector(
                     self.camera.location_world2view(self.dragging_file_location).x,
-                    a0.rect().height(),
+                    rect.height(),
                 ),
                 QColor(148, 220, 254),
                 1,
@@ -1217,7 +1483,7 @@ class Canvas(QMainWindow):
             if self.is_dragging_file_valid:
                 PainterUtils.paint_text_from_center(
                     painter,
-                    NumberVector(a0.rect().width() / 2, a0.rect().height() / 2),
+                    NumberVector(rect.width() / 2, rect.height() / 2),
                     "拖拽文件到窗口中",
                     30,
                     QColor(255, 255, 255),
@@ -1225,7 +1491,7 @@ class Canvas(QMainWindow):
             else:
                 PainterUtils.paint_text_from_center(
                     painter,
-                    NumberVector(a0.rect().width() / 2, a0.rect().height() / 2),
+                    NumberVector(rect.width() / 2, rect.height() / 2),
                     "不支持的文件类型，请拖入json文件",
                     30,
                     QColor(255, 0, 0),
@@ -1241,6 +1507,138 @@ class Canvas(QMainWindow):
         self.paint_test(painter)
         pass
 
+    def _get_scene_layer(self) -> QPixmap:
+        """
+        获取画好的场景图层
+        相机或显示设置变了就整张重画，场景有变化就只重画过期的区域
+        """
+        # 还没来得及取走的变化（比如刚刚改完还没有经过事件循环）也要算上
+        damaged_view_rects = self._take_scene_damage()
+        if damaged_view_rects is None:
+            # 图层整张重画，窗口上其他地方也要跟着重绘
+            self.update()
+        else:
+            for view_rect in damaged_view_rects:
+                self.update(view_rect.toAlignedRect())
+
+        # 相机移动中，而且完整地画一遍场景要超过一帧，就用图块金字塔拼个预览
+        self._update_camera_motion()
+        is_preview = self._is_camera_settling() and (
+            self._is_tile_rendering()
+            or self._scene_paint_time * 1000 > self.TICK_INTERVAL
+        )
+
+        device_pixel_ratio = self.devicePixelRatioF()
+        camera_key = (
+            self.width(),
+            self.height(),
+            device_pixel_ratio,
+            *self._get_camera_state(),
+            SETTING_SERVICE.is_show_grid,
+            SETTING_SERVICE.line_style,
+            SETTING_SERVICE.theme_style,
+            self._is_tile_rendering(),
+            is_preview,
+        )
+        scene_key = (camera_key, self.node_manager.scene_revision)
+        if (
+            self._scene_layer is None
+            or self._scene_layer_key is None
+            or self._scene_layer_key[0] != camera_key
+        ):
+            if not is_preview:
+                self._settled_scene_layer = None
+            elif not self._is_scene_layer_preview and self._scene_layer is not None:
+                # 刚开始移动，留下最后一张完整的图层
+                self._settled_scene_layer = (
+                    self._scene_layer,
+                    self._scene_layer_camera_state,
+                )
+            self._is_scene_layer_preview = is_preview
+            self._scene_layer_camera_state = self._get_camera_state()
+            self._scene_layer = QPixmap(
+                int(self.width() * device_pixel_ratio),
+                int(self.height() * device_pixel_ratio),
+            )
+            self._scene_layer.setDevicePixelRatio(device_pixel_ratio)
+            self._paint_scene_layer(None)
+        elif self._scene_layer_dirty_rects:
+            dirty_rect = QRectF()
+            for view_rect in self._scene_layer_dirty_rects:
+                dirty_rect = dirty_rect.united(view_rect)
+            self._paint_scene_layer(dirty_rect.toAlignedRect())
+        elif self._scene_layer_key != scene_key:
+            # 版本号变了却不知道变了哪里，保险起见整张重画
+            self._paint_scene_layer(None)
+        self._scene_layer_dirty_rects.clear()
+        self._scene_layer_key = scene_key
+        return self._scene_layer
+
+    def _paint_scene_layer(self, view_rect: QRect | None):
+        """
+        把背景、网格、节点、连线画到场景图层上
+        :param view_rect: 只重画这个屏幕范围，None表示整张重画
+        """
+        assert self._scene_layer is not None
+        painter = QPainter(self._scene_layer)
+        clip_rect = None
+        if view_rect is None:
+            view_rect = self.rect()
+        else:
+            painter.setClipRect(view_rect)
+            clip_rect = self._view_rect_to_world(view_rect)
+        # 使用黑色填充
+        painter.fillRect(view_rect, QColor(43, 43, 43, 255))
+        # 画网格
+        if SETTING_SERVICE.is_show_grid:
+            paint_grid(painter, self.camera)
+        if self._is_scene_layer_preview:
+            self._paint_settled_scene_layer(painter)
+        if self._is_scene_layer_preview or self._is_tile_rendering():
+            self.tile_renderer.paint(
+                painter,
+                self.camera,
+                self.devicePixelRatioF(),
+                self.node_manager.get_snapshot,
+                clip_rect,
+                self._is_scene_layer_preview,
+            )
+        else:
+            start_time = time.perf_counter()
+            self.node_manager.paint(
+                PaintContext(
+                    ProjectGraphPainter(painter), self.camera, self.mouse_location
+                ),
+                clip_rect,
+            )
+            if clip_rect is None:
+                self._scene_paint_time = time.perf_counter() - start_time
+        painter.end()
+
+    def _paint_settled_scene_layer(self, painter: QPainter):
+        """
+        把相机开始移动前的完整场景图层按现在的相机位置平移缩放后画上去，
+        后台的图块还没画好的地方就不会是空的
+        """
+        if self._settled_scene_layer is None:
+            return
+        pixmap, (x, y, scale) = self._settled_scene_layer
+        width = pixmap.width() / pixmap.devicePixelRatio()
+        height = pixmap.height() / pixmap.devicePixelRatio()
+        left_top = self.camera.location_world2view(
+            NumberVector(x - width / 2 / scale, y - height / 2 / scale)
+        )
+        ratio = self.camera.current_scale / scale
+        painter.drawPixmap(
+            QRectF(left_top.x, left_top.y, width * ratio, height * ratio),
+            pixmap,
+            QRectF(pixmap.rect()),
+        )
+
+    def _is_tile_rendering(self) -> bool:
+        """节点很多的时候场景分块在后台线程里画"""
+        return len(self.node_manager.nodes) >= SETTING_SERVICE.tile_render_node_count
+
     def paint_test(self, painter: QPainter):
         """测试渲染"""
         # PainterUtils.paint_document_from_left_top(
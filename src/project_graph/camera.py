@@ -12,6 +12,11 @@ class Camera:
     SCALE_MAX = 5000
     SCALE_MIN = 0.0000001
 
+    SPEED_EPSILON = 0.1
+    """速度换算到屏幕上每帧不到这么多像素时，直接当成停下了"""
+    SCALE_EPSILON = 0.001
+    """缩放比例和目标的相对误差小于这个值时，直接吸附到目标"""
+
     """
     空气摩擦力速度指数
     指数=2，表示 f = -k * v^2
@@ -108,6 +113,18 @@ class Camera:
             if self.is_scale_animation_open:
                 self.current_scale += (self.target_scale - self.current_scale) / 10
 
+            # 足够接近时直接吸附，否则速度和缩放只会无限逼近，相机永远停不下来
+            if (
+                self.accelerateCommander.is_zero()
+                and self.speed.magnitude() * self.current_scale < self.SPEED_EPSILON
+            ):
+                self.speed = NumberVector(0, 0)
+            if (
+                abs(self.target_scale - self.current_scale)
+                < self.target_scale * self.SCALE_EPSILON
+            ):
+                self.current_scale = self.target_scale
+
             # 彩蛋，《微观尽头》——刘慈欣
 
             if self.current_scale > self.SCALE_MAX:
@@ -122,6 +139,17 @@ class Camera:
             self.reset()
             self.speed = NumberVector(0, 0)
 
+    @property
+    def is_moving(self) -> bool:
+        """相机是否还在移动或者缩放，静止的时候画面不需要重绘"""
+        return (
+            not self.speed.is_zero()
+            or not self.accelerateCommander.is_zero()
+            or (
+                self.is_scale_animation_open and self.current_scale != self.target_scale
+            )
+        )
+
     @property
     def cover_world_rectangle(self) -> Rectangle:
         """
@@ -72,6 +72,24 @@ class Rectangle:
         """通过四条边来创建矩形"""
         return Rectangle(NumberVector(left, top), right - left, bottom - top)
 
+    @staticmethod
+    def from_points(points: list[NumberVector]) -> "Rectangle":
+        """创建刚好包住这些点的矩形"""
+        return Rectangle.from_edges(
+            min(point.x for point in points),
+            min(point.y for point in points),
+            max(point.x for point in points),
+            max(point.y for point in points),
+        )
+
+    def expand(self, margin: float) -> "Rectangle":
+        """返回一个四周都向外扩了margin的新矩形"""
+        return Rectangle(
+            self.location_left_top - NumberVector(margin, margin),
+            self.width + margin * 2,
+            self.height + margin * 2,
+        )
+
     def get_fore_points(self) -> list[NumberVector]:
         return [
             NumberVector(self.location_left_top.x, self.location_left_top.y),
@@ -147,6 +165,32 @@ class Rectangle:
             and self.top() <= point.y <= self.bottom()
         )
 
+    def subtract(self, rect: "Rectangle") -> list["Rectangle"]:
+        """
+        self去掉和rect重叠的部分之后剩下的区域，切成最多四个互不重叠的矩形条
+        上下两条占满self的宽度，左右两条夹在中间，两个矩形没有重叠时返回self的副本
+        """
+        left = max(self.left(), rect.left())
+        top = max(self.top(), rect.top())
+        right = min(self.right(), rect.right())
+        bottom = min(self.bottom(), rect.bottom())
+        if left >= right or top >= bottom:
+            return [self.clone()]
+        result = []
+        if self.top() < top:
+            result.append(
+                Rectangle.from_edges(self.left(), self.top(), self.right(), top)
+            )
+        if bottom < self.bottom():
+            result.append(
+                Rectangle.from_edges(self.left(), bottom, self.right(), self.bottom())
+            )
+        if self.left() < left:
+            result.append(Rectangle.from_edges(self.left(), top, left, bottom))
+        if right < self.right():
+            result.append(Rectangle.from_edges(right, top, self.right(), bottom))
+        return result
+
     def __repr__(self):
         return f"Rectangle({self.location_left_top}, {self.width}, {self.height})"
 
@@ -0,0 +1,281 @@
+"""
+均匀网格空间索引（空间哈希）
+把世界平面切成一个个正方形格子，物体按照外接矩形登记到它覆盖的格子里，
+查询某个点或某个矩形附近的物体时，只需要看相关的几个格子，不用遍历全部物体。
+"""
+
+import math
+from typing import Generic, Hashable, Iterator, TypeVar
+
+from project_graph.data_struct.line import Line
+from project_graph.data_struct.number_vector import NumberVector
+from project_graph.data_struct.rectangle import Rectangle
+
+T = TypeVar("T", bound=Hashable)
+
+
+class SpatialHash(Generic[T]):
+    """
+    均匀网格空间索引
+    登记进来的物体只看外接矩形，查询结果是外接矩形命中的物体，
+    更精细的判断（比如严格的碰撞检测）交给调用方
+    """
+
+    def __init__(self, cell_size: float = 256):
+        self.cell_size = cell_size
+        """格子边长，世界坐标"""
+
+        self._cells: dict[tuple[int, int], dict[T, None]] = {}
+        """格子坐标 -> 格子里的物体，用dict当有序集合用"""
+
+        self._items: dict[
+            T, tuple[tuple[float, float, float, float], tuple[int, int, int, int]]
+        ] = {}
+        """物体 -> (登记时的外接矩形的左上右下边, 覆盖的格子范围)"""
+
+        self._lines: dict[T, Line] = {}
+        """用insert_line登记的物体 -> 登记时的线段，这些物体只在线段经过的格子里"""
+
+        self._owned_cells: set[tuple[int, int]] = set()
+        """
+        可以直接修改的格子，不在这里的格子和复制出来的索引共用，修改之前要先复制一份
+        见copy
+        """
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._items
+
+    def _cell_range(self, rect: Rectangle) -> tuple[int, int, int, int]:
+        """矩形覆盖的格子范围，闭区间 (x0, y0, x1, y1)"""
+        return (
+            math.floor(rect.left() / self.cell_size),
+            math.floor(rect.top() / self.cell_size),
+            math.floor(rect.right() / self.cell_size),
+            math.floor(rect.bottom() / self.cell_size),
+        )
+
+    @staticmethod
+    def _edges(rect: Rectangle) -> tuple[float, float, float, float]:
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    def insert(self, item: T, bounds: Rectangle):
+        """
+        登记一个物体，如果已经登记过，相当于更新
+        :param bounds: 物体的外接矩形，内部只记录它当时的四条边
+        """
+        if item in self._items:
+            self.update(item, bounds)
+            return
+        cell_range = self._cell_range(bounds)
+        self._items[item] = (self._edges(bounds), cell_range)
+        x0, y0, x1, y1 = cell_range
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self._get_writable_cell((cx, cy))[item] = None
+
+    def insert_line(self, item: T, line: Line):
+        """
+        按线段登记一个物体，如果已经登记过，相当于更新
+        只登记到线段经过的格子里，很长的斜线段也只占一条窄带上的格子，
+        不会像按外接矩形登记那样占满整个外接矩形，格子数量和长度的平方成正比
+        查询结果只会比按外接矩形登记时少掉那些线段根本没经过的范围
+        """
+        self.remove(item)
+        bounds = Rectangle.from_points([line.start, line.end])
+        self._items[item] = (self._edges(bounds), self._cell_range(bounds))
+        self._lines[item] = line
+        for cell_key in self._iter_line_cells(line):
+            self._get_writable_cell(cell_key)[item] = None
+
+    def remove(self, item: T) -> bool:
+        """移除一个物体，返回是否真的移除了，insert_line登记的物体也用这个移除"""
+        record = self._items.pop(item, None)
+        if record is None:
+            return False
+        line = self._lines.pop(item, None)
+        if line is not None:
+            for cell_key in self._iter_line_cells(line):
+                self._remove_from_cell(cell_key, item)
+            return True
+        x0, y0, x1, y1 = record[1]
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self._remove_from_cell((cx, cy), item)
+        return True
+
+    def _get_writable_cell(self, cell_key: tuple[int, int]) -> dict[T, None]:
+        """获取一个可以直接修改的格子，格子不存在就新建，和别的索引共用的就先复制一份"""
+        cell = self._cells.get(cell_key)
+        if cell is None:
+            cell = self._cells[cell_key] = {}
+        elif cell_key not in self._owned_cells:
+            cell = self._cells[cell_key] = dict(cell)
+        self._owned_cells.add(cell_key)
+        return cell
+
+    def _remove_from_cell(self, cell_key: tuple[int, int], item: T):
+        """把物体从一个格子里去掉，格子空了就删掉"""
+        cell = self._cells.get(cell_key)
+        if cell is None or item not in cell:
+            return
+        if len(cell) == 1:
+            del self._cells[cell_key]
+            self._owned_cells.discard(cell_key)
+            return
+        del self._get_writable_cell(cell_key)[item]
+
+    def update(self, item: T, bounds: Rectangle):
+        """物体移动或者改变大小之后，更新它的外接矩形"""
+        record = self._items.get(item)
+        if record is None:
+            self.insert(item, bounds)
+            return
+        if item not in self._lines and self._cell_range(bounds) == record[1]:
+            # 还在原来的格子里，只更新外接矩形
+            self._items[item] = (self._edges(bounds), record[1])
+            return
+        self.remove(item)
+        self.insert(item, bounds)
+
+    def clear(self):
+        self._cells.clear()
+        self._items.clear()
+        self._lines.clear()
+        self._owned_cells.clear()
+
+    def copy(self) -> "SpatialHash[T]":
+        """
+        复制一份索引，之后两边各改各的，互不影响
+        格子是写时复制的：这里只拷贝格子表和物体表，格子本身两边共用，
+        哪边要改某个格子，才把那一个格子复制一份，所以节点很多时也能频繁复制
+        """
+        result: SpatialHash[T] = SpatialHash(self.cell_size)
+        result._cells = self._cells.copy()
+        result._items = self._items.copy()
+        result._lines = self._lines.copy()
+        self._owned_cells = set()
+        return result
+
+    def get_bounds(self, item: T) -> Rectangle | None:
+        """获取物体登记时的外接矩形，没有登记过返回None"""
+        record = self._items.get(item)
+        if record is None:
+            return None
+        return Rectangle.from_edges(*record[0])
+
+    def _iter_cells_in_range(
+        self, x0: int, y0: int, x1: int, y1: int
+    ) -> Iterator[tuple[tuple[int, int], dict[T, None]]]:
+        """遍历范围内所有非空的格子，返回 (格子坐标, 格子里的物体)"""
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # 查询范围比非空格子还多（比如视野缩得很小），直接遍历非空格子更快
+            for (cx, cy), cell in self._cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    yield (cx, cy), cell
+            return
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    yield (cx, cy), cell
+
+    def count_cells(self, rect: Rectangle) -> list[tuple[int, int, int]]:
+        """
+        统计rect范围内每个非空格子里有多少物体，用于画密度图
+        :return: [(格子x, 格子y, 物体数量)]，格子的世界坐标是 格子坐标 * cell_size
+        """
+        return [
+            (cx, cy, len(cell))
+            for (cx, cy), cell in self._iter_cells_in_range(*self._cell_range(rect))
+        ]
+
+    def query_point(self, point: NumberVector) -> list[T]:
+        """查询外接矩形包含这个点的所有物体"""
+        cell = self._cells.get(
+            (
+                math.floor(point.x / self.cell_size),
+                math.floor(point.y / self.cell_size),
+            )
+        )
+        if cell is None:
+            return []
+        x, y = point.x, point.y
+        result = []
+        for item in cell:
+            left, top, right, bottom = self._items[item][0]
+            if left <= x <= right and top <= y <= bottom:
+                result.append(item)
+        return result
+
+    def query_rect(self, rect: Rectangle) -> list[T]:
+        """
+        查询外接矩形和rect有重叠（包括贴边）的所有物体
+        insert_line登记的物体还要经过rect覆盖的格子，外接矩形重叠但线段离得很远的查不到
+        """
+        left, top, right, bottom = self._edges(rect)
+        items = self._items
+        result: dict[T, None] = {}
+        for _, cell in self._iter_cells_in_range(*self._cell_range(rect)):
+            for item in cell:
+                if item in result:
+                    continue
+                item_left, item_top, item_right, item_bottom = items[item][0]
+                if (
+                    item_left <= right
+                    and item_right >= left
+                    and item_top <= bottom
+                    and item_bottom >= top
+                ):
+                    result[item] = None
+        return list(result)
+
+    def _iter_line_cells(self, line: Line) -> Iterator[tuple[int, int]]:
+        """
+        线段经过的所有格子
+        按列遍历，算出线段在每一列里的纵坐标范围，只取这个范围内的格子，
+        斜着的长线段也只会经过一条窄带，不会把整个外接矩形里的格子都看一遍
+        """
+        start, end = line.start, line.end
+        if start.x > end.x:
+            start, end = end, start
+        size = self.cell_size
+        for cx in range(math.floor(start.x / size), math.floor(end.x / size) + 1):
+            if start.x == end.x:
+                y0, y1 = start.y, end.y
+            else:
+                slope = (end.y - start.y) / (end.x - start.x)
+                y0 = start.y + (max(start.x, cx * size) - start.x) * slope
+                y1 = start.y + (min(end.x, (cx + 1) * size) - start.x) * slope
+            for cy in range(
+                math.floor(min(y0, y1) / size), math.floor(max(y0, y1) / size) + 1
+            ):
+                yield cx, cy
+
+    def query_line(self, line: Line) -> list[T]:
+        """
+        查询登记在线段经过的格子里、并且外接矩形和线段的外接矩形有重叠的物体
+        结果只是候选，线段和物体是不是真的相交交给调用方判断
+        """
+        left, right = min(line.start.x, line.end.x), max(line.start.x, line.end.x)
+        top, bottom = min(line.start.y, line.end.y), max(line.start.y, line.end.y)
+        items = self._items
+        result: dict[T, None] = {}
+        for cell_key in self._iter_line_cells(line):
+            cell = self._cells.get(cell_key)
+            if cell is None:
+                continue
+            for item in cell:
+                if item in result:
+                    continue
+                item_left, item_top, item_right, item_bottom = items[item][0]
+                if (
+                    item_left <= right
+                    and item_right >= left
+                    and item_top <= bottom
+                    and item_bottom >= top
+                ):
+                    result[item] = None
+        return list(result)
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 
+from project_graph.data_struct.rectangle import Rectangle
 from project_graph.paint.paintables import Paintable, PaintContext
 
 
@@ -26,6 +27,13 @@ class Effect(Paintable, ABC):
     def paint(self, context: PaintContext):
         pass
 
+    def get_bounds(self) -> Rectangle | None:
+        """
+        特效当前画在世界坐标的什么范围内，用于局部重绘
+        线宽这些屏幕像素上的粗细不用算进去，返回None表示不确定，整个画面都要重绘
+        """
+        return None
+
     @property
     def finish_rate(self):
         """
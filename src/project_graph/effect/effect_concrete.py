@@ -24,6 +24,9 @@ class EffectCuttingFlash(Effect):
         super().__init__(duration)
         self.line = line
 
+    def get_bounds(self) -> Rectangle | None:
+        return Rectangle.from_points([self.line.start, self.line.end])
+
     def paint(self, context: PaintContext):
         direction = self.line.end - self.line.start
         # 外部粗线
@@ -60,6 +63,9 @@ class EffectRectangleFlash(Effect):
         super().__init__(duration)
         self.rect = rect
 
+    def get_bounds(self) -> Rectangle | None:
+        return self.rect.clone()
+
     def get_components(self) -> List[Paintable]:
         return []
 
@@ -90,6 +96,9 @@ class EffectRectangleShrink(Effect):
         super().__init__(duration)
         self.current_rect = rect
 
+    def get_bounds(self) -> Rectangle | None:
+        return self.current_rect.clone()
+
     def get_components(self) -> List[Paintable]:
         return []
 
@@ -120,6 +129,9 @@ class EffectCircleExpand(Effect):
         super().__init__(duration)
         self.circle = Circle(center_location, 0)
 
+    def get_bounds(self) -> Rectangle | None:
+        return Rectangle(self.circle.center, 0, 0).expand(self.circle.radius)
+
     def get_components(self) -> List[Paintable]:
         return []
 
@@ -1,3 +1,4 @@
+from project_graph.data_struct.rectangle import Rectangle
 from project_graph.effect.effect import Effect
 from project_graph.paint.paintables import PaintContext
 
@@ -9,6 +10,21 @@ class EffectManager:
     def add_effect(self, effect: Effect):
         self.effects.append(effect)
 
+    @property
+    def is_playing(self) -> bool:
+        """是否还有特效在播放"""
+        return len(self.effects) > 0
+
+    def get_bounds_list(self) -> list[Rectangle] | None:
+        """所有特效当前的绘制范围，有任何一个特效不确定范围就返回None"""
+        bounds_list = []
+        for effect in self.effects:
+            bounds = effect.get_bounds()
+            if bounds is None:
+                return None
+            bounds_list.append(bounds)
+        return bounds_list
+
     def tick(self):
         for effect in self.effects:
             effect.tick()
@@ -1,12 +1,15 @@
-from typing import List
+from typing import KeysView, List
 from uuid import uuid4
 
-from PyQt5.QtGui import QColor
+from PyQt5.QtGui import QColor, QStaticText
 
 from project_graph.data_struct.number_vector import NumberVector
+from project_graph.data_struct.rectangle import Rectangle
 from project_graph.entity.entity import Entity
+from project_graph.paint.document_cache import DOCUMENT_CACHE
 from project_graph.paint.paint_utils import PainterUtils
 from project_graph.paint.paintables import Paintable, PaintContext
+from project_graph.settings.setting_service import SETTING_SERVICE
 from project_graph.tools.string_tools import get_size_by_text
 
 
@@ -22,25 +25,34 @@ class EntityNode(Entity):
 
     def __init__(self, body_shape):
         super().__init__(body_shape)
-        self.children: list["EntityNode"] = []
+        self._children: dict["EntityNode", None] = {}
+        """子节点，用dict当有序集合用，既能O(1)判重又能保留连接的先后顺序"""
+        self.parents: set["EntityNode"] = set()
+        """父节点（反向连接），由add_child和remove_child维护，不要直接修改"""
 
         self._inner_text = "..."
+        self._text_cache: tuple[int, QStaticText, int] | None = None
+        """(字体大小, 排好版的文字, 文字宽度)，文字或者缩放后的字体大小变了就要重新排版"""
 
-        self.details = ""
-        """节点详细文字"""
+        self._details = ""
         self.is_detail_show = False
         """是否显示详细文字"""
 
         self.uuid = str(uuid4())
 
         self.is_selected = False
-        """是否是被选中的状态, 包括框选"""
+        """是否是被选中的状态, 包括框选，由NodeManager的选中集合维护，不要直接修改"""
         self.adjust_size_by_text()
 
         # 颜色
         self.color = QColor(204, 204, 204)
         pass
 
+    @property
+    def children(self) -> KeysView["EntityNode"]:
+        """子节点，只读视图，增删子节点要通过add_child和remove_child"""
+        return self._children.keys()
+
     @property
     def inner_text(self) -> str:
         return self._inner_text
@@ -48,8 +60,33 @@ class EntityNode(Entity):
     @inner_text.setter
     def inner_text(self, value: str):
         self._inner_text = value
+        self._text_cache = None
         self.adjust_size_by_text()
 
+    @property
+    def details(self) -> str:
+        """节点详细文字"""
+        return self._details
+
+    @details.setter
+    def details(self, value: str):
+        if value != self._details:
+            # 旧文字的排版不会再用到了，提前从缓存里清掉
+            DOCUMENT_CACHE.discard_text(self._details)
+        self._details = value
+
+    def _get_static_text(self, font_size: int) -> tuple[QStaticText, int]:
+        """
+        获取排好版的节点文字，字体大小相当于缩放档位，变了才重新排版
+        :return: (排好版的文字, 文字宽度)
+        """
+        if self._text_cache is None or self._text_cache[0] != font_size:
+            self._text_cache = (
+                font_size,
+                *PainterUtils.create_static_text(self._inner_text, font_size),
+            )
+        return self._text_cache[1], self._text_cache[2]
+
     def dump(self) -> dict:
         """
         转化成字典格式
@@ -85,52 +122,90 @@ class EntityNode(Entity):
         if entity_node is self:
             return False
         # 增加之前先看看是否已经有了
-        if entity_node in self.children:
+        if entity_node in self._children:
             return False
-        self.children.append(entity_node)
+        self._children[entity_node] = None
+        entity_node.parents.add(self)
         return True
 
     def remove_child(self, entity_node):
-        if entity_node not in self.children:
+        if entity_node not in self._children:
             return False
-        self.children.remove(entity_node)
+        del self._children[entity_node]
+        entity_node.parents.discard(self)
         return True
 
+    def remove_all_connections(self):
+        """断开和所有父节点、子节点的连接，删除节点的时候使用"""
+        for father_node in list(self.parents):
+            father_node.remove_child(self)
+        for child in list(self._children):
+            self.remove_child(child)
+
     def get_components(self) -> List[Paintable]:
         return super().get_components()
 
-    def paint(self, context: PaintContext):
-        # 绘制边框
+    def get_details_rect(self, scale: float) -> Rectangle:
+        """详细文字在世界坐标中占的范围，和paint里画详细文字的参数保持一致"""
+        document = DOCUMENT_CACHE.get(
+            self._details, 400 * scale, 15 * scale, QColor(255, 255, 255)
+        )
+        return Rectangle(
+            self.body_shape.location_left_top + NumberVector(0, self.body_shape.height),
+            document.size().width() / scale,
+            document.size().height() / scale,
+        )
+
+    @staticmethod
+    def paint_frame(context: PaintContext, body_shape: Rectangle, color: QColor):
+        """绘制节点的边框和底色，后台线程画场景快照时也用这个，所以不依赖节点对象"""
         PainterUtils.paint_rect(
             context.painter.q_painter(),
-            context.camera.location_world2view(self.body_shape.location_left_top),
-            self.body_shape.width * context.camera.current_scale,
-            self.body_shape.height * context.camera.current_scale,
+            context.camera.location_world2view(body_shape.location_left_top),
+            body_shape.width * context.camera.current_scale,
+            body_shape.height * context.camera.current_scale,
             QColor(31, 31, 31, 200),
-            self.color,
+            color,
             int(2 * context.camera.current_scale),
             16 * context.camera.current_scale,
         )
 
-        PainterUtils.paint_text_from_center(
-            context.painter.q_painter(),
-            context.camera.location_world2view(self.body_shape.center),
-            self.inner_text,
-            self.FONT_SIZE * context.camera.current_scale,
-            self.color,
-        )
+    def paint(self, context: PaintContext):
+        # 绘制边框
+        self.paint_frame(context, self.body_shape, self.color)
+
+        if context.camera.current_scale >= SETTING_SERVICE.lod_text_scale:
+            # 缩得太小的时候文字已经看不清了，不画
+            font_size = int(self.FONT_SIZE * context.camera.current_scale)
+            static_text, text_width = self._get_static_text(font_size)
+            PainterUtils.paint_static_text_from_center(
+                context.painter.q_painter(),
+                context.camera.location_world2view(self.body_shape.center),
+                static_text,
+                text_width,
+                font_size,
+                self.color,
+            )
+        pass
+
+    def paint_overlay(self, context: PaintContext):
+        """
+        绘制详细文字和选中框
+        这两样随着鼠标悬停和选择经常变化，不画进缓存的场景图层里，每次直接叠加在上面
+        """
         if self.is_detail_show:
-            PainterUtils.paint_document_from_left_top(
+            PainterUtils.paint_document(
                 context.painter.q_painter(),
                 context.camera.location_world2view(
                     self.body_shape.location_left_top
                     + NumberVector(0, self.body_shape.height)
                 ),
-                self.details,
-                400 * context.camera.current_scale,
-                15 * context.camera.current_scale,
-                QColor(255, 255, 255),
-                QColor(0, 0, 0, 128),
+                DOCUMENT_CACHE.get(
+                    self._details,
+                    400 * context.camera.current_scale,
+                    15 * context.camera.current_scale,
+                    QColor(255, 255, 255),
+                ),
             )
         if self.is_selected:
             PainterUtils.paint_rect(
@@ -1,15 +1,30 @@
-from PyQt5.QtGui import QColor
+import math
+from typing import Callable, Iterable, KeysView
+
+from PyQt5.QtCore import QPointF, QRectF, Qt
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen
 
 from project_graph.data_struct.circle import Circle
 from project_graph.data_struct.curve import ConnectCurve
 from project_graph.data_struct.line import Line
 from project_graph.data_struct.number_vector import NumberVector
 from project_graph.data_struct.rectangle import Rectangle
+from project_graph.data_struct.spatial_hash import SpatialHash
 from project_graph.entity.entity_node import EntityNode
 from project_graph.paint.paint_utils import PainterUtils
 from project_graph.paint.paintables import PaintContext
+from project_graph.paint.scene_snapshot import (
+    Edge,
+    NodeRecord,
+    SceneBase,
+    SceneSnapshot,
+)
+from project_graph.physics.collision_engine import CollisionEngine
 from project_graph.settings.setting_service import SETTING_SERVICE
 
+EdgePaths = tuple[list[QPainterPath], list[QPainterPath]]
+"""合并好的连线路径：(描边的路径, 填充的路径)"""
+
 
 class NodeManager:
     """
@@ -17,11 +32,94 @@ class NodeManager:
     节点的增删改、连接断开、移动、渲染等操作都在这里进行
     """
 
+    PAINT_CULL_MARGIN = 30
+    """视野剔除时视野矩形向外扩的距离，世界坐标，要能盖住选中框和箭头这些超出本体的部分"""
+
+    DENSITY_BLOCK_SIZE = 8
+    """密度色块的最小边长，像素"""
+
+    MAX_DAMAGED_RECTS = 256
+    """待重绘区域最多记录多少个，再多就直接整个画面重绘"""
+
+    SNAPSHOT_REBASE_RATIO = 0.02
+    """场景快照的底稿之后改过的节点和连线超过底稿总数的这个比例，就重新复制一份底稿"""
+
+    ARROW_PATH_BATCH_SIZE = 16
+    """
+    多少个箭头合并成一条路径
+    qt填充一条很大的路径反而比分开画慢，所以箭头是分成小批合并的，曲线本身只描边不受影响
+    """
+
     def __init__(self):
         self.nodes: list[EntityNode] = []
 
-        self._lines: list[Line] = []
-        """lines只用于绘制的时候给一个缓存，不参与逻辑运算，只在改变的时候重新计算"""
+        self._uuid_to_node: dict[str, EntityNode] = {}
+        """uuid -> 节点，和nodes保持同步，用于按uuid快速查找节点"""
+
+        self._node_index: SpatialHash[EntityNode] = SpatialHash()
+        """节点的空间索引，用于鼠标点击、悬停等位置查询，节点位置或大小变化后要及时更新"""
+
+        self._collision_engine = CollisionEngine(
+            self._node_index, self._on_node_shape_changed
+        )
+        """节点碰撞，被挤开的节点会通过回调更新索引和连线"""
+
+        self._edge_lines: dict[tuple[EntityNode, EntityNode], Line] = {}
+        """
+        (父节点, 子节点) -> 裁剪到两个节点边缘的连线
+        只用于绘制的时候给一个缓存，不参与逻辑运算，只在改变的时候重新计算
+        增删改都要通过_set_edge_line和_pop_edge_line，保持和_edge_index同步
+        """
+        self._edge_index: SpatialHash[tuple[EntityNode, EntityNode]] = SpatialHash()
+        """连线的空间索引，按_edge_lines里的线段经过的格子登记，用于视野裁剪和切割"""
+        self._dirty_nodes: set[EntityNode] = set()
+        """位置或大小变了、相连的线还没有重新计算的节点"""
+        self._edge_curves: dict[tuple[EntityNode, EntityNode], ConnectCurve] = {}
+        """
+        (父节点, 子节点) -> 构造好的贝塞尔曲线，和_edge_lines对应
+        连线的两个端点没变就一直复用，不用每次重建路径都重新构造曲线
+        """
+        self._damaged_rects: list[Rectangle] | None = []
+        """
+        上次取走之后画面上发生了变化的区域，世界坐标，用于局部重绘
+        None表示变化太多，整个画面都要重绘
+        """
+        self.scene_revision = 0
+        """
+        场景的版本号，节点或连线的样子有任何变化都会加一
+        画布据此判断缓存的场景图层是不是过期了
+        """
+        self._edge_revision = 0
+        """连线缓存的版本号，连线有任何增删改都要加一，批量绘制的路径据此判断要不要重建"""
+        self._edge_paths_cache: tuple[tuple, int, EdgePaths] | None = None
+        """(缓存条件, 路径里的连线数量, 合并好的连线路径)，条件不变就直接拿来画"""
+        self._node_records: dict[EntityNode, NodeRecord] = {}
+        """
+        节点 -> 后台线程绘制需要的数据，和_node_index同步更新
+        创建快照时直接复制这个表，不用每次把所有节点都读一遍
+        """
+        self._snapshot_base: SceneBase | None = None
+        """场景快照的底稿，没有用到快照（节点不多、不分块绘制）时是None"""
+        self._snapshot_changed_nodes: set[EntityNode] = set()
+        """底稿之后增删改过的节点"""
+        self._snapshot_changed_edges: set[Edge] = set()
+        """底稿之后增删改过的连线"""
+        self._snapshot: SceneSnapshot | None = None
+        """上一次创建的场景快照，场景没变就一直复用"""
+
+        self.painted_node_count = 0
+        """上一次绘制时实际画出的节点数量，调试信息用"""
+        self.culled_node_count = 0
+        """上一次绘制时因为不在视野内而跳过的节点数量，调试信息用"""
+        self.painted_line_count = 0
+        """上一次绘制时实际画出的连线数量，调试信息用"""
+        self.culled_line_count = 0
+        """上一次绘制时因为不在视野内而跳过的连线数量，调试信息用"""
+
+        self._selected_nodes: dict[EntityNode, None] = {}
+        """被选中的节点，用dict当有序集合用，和节点的is_selected保持一致"""
+        self._selection_listeners: list[Callable[[list[EntityNode]], None]] = []
+        """选中状态变化的监听者，参数是选中状态发生了变化的节点"""
 
         self.cursor_node: EntityNode | None = None
         """有一个游标在节点群上移动，这个游标通过上下左右或者点击更改附着的节点"""
@@ -187,24 +285,24 @@ class NodeManager:
         """
         刷新所有节点的uuid, 并返回更新后的字典
         刷新的意义是用户可能会重复复制添加一大堆节点内容，防止出现uuid冲突
+        只浅拷贝每个节点的字典，不会修改传入的data
         """
-        from copy import deepcopy
         from uuid import uuid4
 
-        new_data = deepcopy(data)
-        for node in new_data["nodes"]:
-            # 把每个节点的uuid都改成新的uuid
-            old_uuid = node["uuid"]
-            new_uuid = str(uuid4())
-            node["uuid"] = new_uuid
-
-            for _, other_node in enumerate(new_data["nodes"]):
-                if other_node == node:
-                    continue
-                for j, child_uuid in enumerate(other_node.get("children", [])):
-                    if child_uuid == old_uuid:
-                        other_node["children"][j] = new_uuid
-        return new_data
+        # 先建立 旧uuid -> 新uuid 的映射，再一次性替换所有节点的uuid和children
+        uuid_map = {node["uuid"]: str(uuid4()) for node in data["nodes"]}
+        new_nodes = []
+        for node in data["nodes"]:
+            new_node = dict(node)
+            new_node["uuid"] = uuid_map[node["uuid"]]
+            if "children" in node:
+                # 不在这份数据里的子节点uuid保持原样
+                new_node["children"] = [
+                    uuid_map.get(child_uuid, child_uuid)
+                    for child_uuid in node["children"]
+                ]
+            new_nodes.append(new_node)
+        return {**data, "nodes": new_nodes}
 
     def add_from_dict(
         self, data: dict, location_world: NumberVector, refresh_uuid=True
@@ -214,6 +312,11 @@ class NodeManager:
         """
         if refresh_uuid:
             data = self._refresh_all_uuid(data)
+        # 一次加进来很多节点的话，逐个记录变化区域也会溢出，直接整个重绘
+        is_bulk = len(data["nodes"]) > self.MAX_DAMAGED_RECTS
+        if is_bulk:
+            self._damaged_rects = None
+            self.scene_revision += 1
         # 开始构建节点本身
         for node_data in data["nodes"]:
             assert isinstance(node_data, dict)
@@ -239,6 +342,13 @@ class NodeManager:
 
             node.uuid = node_data["uuid"]
             self.nodes.append(node)
+            self._uuid_to_node[node.uuid] = node
+            self._node_index.insert(node, node.body_shape)
+            self._set_node_record(node)
+            # 连线由update_dirty_lines算出来的时候再记录变化区域
+            self._dirty_nodes.add(node)
+            if not is_bulk:
+                self._damage(node.body_shape)
 
         # 构建节点之间的连接关系
         for node_data in data["nodes"]:
@@ -250,8 +360,6 @@ class NodeManager:
                 if child is None:
                     continue
                 node.add_child(child)
-
-        self.update_lines()
         pass
 
     def load_from_dict(self, data: dict):
@@ -260,188 +368,778 @@ class NodeManager:
         """
         # 先清空原有节点
         self.nodes.clear()
+        self._uuid_to_node.clear()
+        self.clear_selection()
+        self._node_index.clear()
+        self._node_records.clear()
+        self._drop_snapshot_base()
+        self._edge_lines.clear()
+        self._edge_index.clear()
+        self._edge_curves.clear()
+        self._dirty_nodes.clear()
+        self._damaged_rects = None
+        self.scene_revision += 1
+        self._edge_revision += 1
         self.add_from_dict(data, NumberVector(0, 0), refresh_uuid=False)
-        self.update_lines()
 
     def get_node_by_uuid(self, uuid: str) -> EntityNode | None:
-        for node in self.nodes:
-            if node.uuid == uuid:
-                return node
+        return self._uuid_to_node.get(uuid)
+
+    def is_node_exist(self, node: EntityNode) -> bool:
+        """判断节点是否还在管理之中（没有被删除）"""
+        return self._uuid_to_node.get(node.uuid) is node
+
+    def get_node_by_location(self, location_world: NumberVector) -> EntityNode | None:
+        """
+        获取某个世界坐标位置上的节点，如果有多个重叠的节点，返回其中一个
+        """
+        nodes = self.nodes_at_point(location_world)
+        if nodes:
+            return nodes[0]
         return None
 
-    def move_node(self, node: EntityNode, d_location: NumberVector):
+    def nodes_at_point(self, location_world: NumberVector) -> list[EntityNode]:
         """
-        移动一个节点（不带动子节点的单独移动）
+        获取包含这个世界坐标点的所有节点
         """
-        node.move(d_location)
-        self.collide_dfs(node)
-        self.update_lines()
+        return [
+            node
+            for node in self._node_index.query_point(location_world)
+            if node.body_shape.is_contain_point(location_world)
+        ]
 
-    def move_node_with_children(self, node: EntityNode, d_location: NumberVector):
+    def nodes_in_rect(self, rect: Rectangle) -> list[EntityNode]:
         """
-        移动一个节点（带动子节点的整体移动）
+        获取和这个世界坐标矩形有重叠的所有节点
+        """
+        return [
+            node
+            for node in self._node_index.query_rect(rect)
+            if node.body_shape.is_collision(rect)
+        ]
+
+    @property
+    def selected_nodes(self) -> KeysView[EntityNode]:
+        """被选中的节点，只读视图，改变选中状态要通过select_nodes等方法"""
+        return self._selected_nodes.keys()
+
+    def add_selection_listener(self, listener: Callable[[list[EntityNode]], None]):
+        """
+        监听选中状态的变化
+        :param listener: 有节点被选中或取消选中时调用，参数是选中状态发生了变化的节点
         """
-        self._move_node_with_children_dfs(node, d_location, [node.uuid])
-        self.update_lines()
+        self._selection_listeners.append(listener)
 
-    def _move_node_with_children_dfs(
-        self, node: EntityNode, d_location: NumberVector, visited_uuids: list[str]
+    def _set_nodes_selected(self, nodes: Iterable[EntityNode], is_selected: bool):
+        changed_nodes = []
+        for node in nodes:
+            if node.is_selected == is_selected:
+                continue
+            node.is_selected = is_selected
+            if is_selected:
+                self._selected_nodes[node] = None
+            else:
+                del self._selected_nodes[node]
+            changed_nodes.append(node)
+        if not changed_nodes:
+            return
+        for listener in self._selection_listeners:
+            listener(changed_nodes)
+
+    def select_nodes(self, nodes: Iterable[EntityNode]):
+        """选中这些节点，已经选中的不变"""
+        self._set_nodes_selected(nodes, True)
+
+    def deselect_nodes(self, nodes: Iterable[EntityNode]):
+        """取消选中这些节点，本来就没选中的不变"""
+        self._set_nodes_selected(nodes, False)
+
+    def clear_selection(self):
+        """取消选中所有节点"""
+        self._set_nodes_selected(list(self._selected_nodes), False)
+
+    def _damage(self, rect: Rectangle):
+        """记录一块画面发生了变化的区域"""
+        self.scene_revision += 1
+        if self._damaged_rects is None:
+            return
+        if len(self._damaged_rects) >= self.MAX_DAMAGED_RECTS:
+            self._damaged_rects = None
+            return
+        # 扩一圈，盖住选中框、箭头这些超出本体的部分
+        self._damaged_rects.append(rect.expand(self.PAINT_CULL_MARGIN))
+
+    def _damage_line(self, line: Line):
+        if self._damaged_rects is None:
+            # 已经要整个画面重绘了，不用再算连线的范围
+            self.scene_revision += 1
+            return
+        self._damage(Rectangle.from_points([line.start, line.end]))
+
+    def take_damaged_rects(self) -> list[Rectangle] | None:
+        """
+        取走上次取走之后画面上发生了变化的区域（世界坐标），用于局部重绘
+        :return: None表示变化太多，整个画面都要重绘
+        """
+        # 连线是延迟到这里才重新计算的，要先算出来才知道新连线的位置
+        self.update_dirty_lines()
+        damaged_rects = self._damaged_rects
+        self._damaged_rects = []
+        return damaged_rects
+
+    def _on_node_shape_changed(self, node: EntityNode):
+        """
+        节点的位置或大小发生变化后调用
+        更新空间索引，并标记和它相连的线需要重新计算
+        """
+        self._update_node_bounds(node)
+        self._dirty_nodes.add(node)
+
+    def _update_node_bounds(self, node: EntityNode):
+        """把节点新的外接矩形更新进空间索引，新旧位置都要重绘"""
+        old_bounds = self._node_index.get_bounds(node)
+        if old_bounds is not None:
+            self._damage(old_bounds)
+        self._damage(node.body_shape)
+        self._node_index.update(node, node.body_shape)
+        self._set_node_record(node)
+
+    def _set_node_record(self, node: EntityNode):
+        """节点新增或者样子变了，更新给场景快照用的数据"""
+        self._node_records[node] = (
+            node.body_shape.location_left_top.x,
+            node.body_shape.location_left_top.y,
+            node.body_shape.width,
+            node.body_shape.height,
+            node.inner_text,
+            node.color.rgba(),
+        )
+        self._mark_snapshot_changed(node=node)
+
+    def _mark_snapshot_changed(
+        self, node: EntityNode | None = None, edge: Edge | None = None
     ):
+        """
+        记下底稿之后改过的节点或连线，下一个快照只需要带上这些
+        改得太多了就扔掉底稿，快照带上的改动太多反而比重新复制一份还慢
+        """
+        if self._snapshot_base is None:
+            return
+        if node is not None:
+            self._snapshot_changed_nodes.add(node)
+        if edge is not None:
+            self._snapshot_changed_edges.add(edge)
+        if (
+            len(self._snapshot_changed_nodes) + len(self._snapshot_changed_edges)
+            > len(self._snapshot_base) * self.SNAPSHOT_REBASE_RATIO
+        ):
+            self._drop_snapshot_base()
+
+    def _drop_snapshot_base(self):
+        """扔掉快照的底稿，下次用到快照时再完整复制一份"""
+        self._snapshot_base = None
+        self._snapshot_changed_nodes.clear()
+        self._snapshot_changed_edges.clear()
+
+    def edit_node_inner_text(self, node: EntityNode, text: str):
+        """
+        修改节点文字，节点大小会随文字变化
+        """
+        node.inner_text = text
+        self._on_node_shape_changed(node)
+
+    def set_node_color(self, node: EntityNode, color: QColor):
+        """
+        修改节点颜色
+        """
+        node.color = color
+        self._set_node_record(node)
+        self._damage(node.body_shape)
+
+    def move_node(self, node: EntityNode, d_location: NumberVector):
+        """
+        移动一个节点（不带动子节点的单独移动）
+        """
         node.move(d_location)
-        self.collide_dfs(node)
-        for child in node.children:
-            if child.uuid in visited_uuids:
-                # 防止出现环形连接，导致无限递归
-                continue
-            self._move_node_with_children_dfs(
-                child, d_location, visited_uuids + [node.uuid]
+        self._on_node_shape_changed(node)
+        self._collision_engine.resolve([node])
+
+    def move_nodes(self, nodes: Iterable[EntityNode], d_location: NumberVector):
+        """
+        整体移动一组节点（不带动子节点），组内节点的相对位置不变
+        组内的节点之间不处理碰撞，整组当成一个整体去推开组外的节点，碰撞只处理一次
+        """
+        group = dict.fromkeys(nodes)
+        # 之前没来得及重新计算的连线先算好，组内的连线才能在此基础上直接平移
+        self.update_dirty_lines()
+        for node in group:
+            node.move(d_location)
+            self._update_node_bounds(node)
+        # 两端都在组里的连线跟着平移就行，只有一端在组里的才需要重新裁剪
+        edges: dict[tuple[EntityNode, EntityNode], None] = {}
+        for node in group:
+            edges.update(dict.fromkeys((node, child) for child in node.children))
+            edges.update(
+                dict.fromkeys((father_node, node) for father_node in node.parents)
             )
+        for edge in edges:
+            old_line = self._edge_lines.get(edge)
+            if old_line is not None and edge[0] in group and edge[1] in group:
+                line = Line(old_line.start + d_location, old_line.end + d_location)
+            else:
+                line = self._get_edge_line(*edge)
+            self._replace_edge_line(edge, line)
+        if edges:
+            self._edge_revision += 1
+        self._collision_engine.resolve(group, group.keys())
 
-    def collide_dfs(self, self_node: EntityNode):
+    def move_node_with_children(self, node: EntityNode, d_location: NumberVector):
         """
-        self_node 是主体
-        这个dfs指的不是子节点递归，是和周围其他节点的碰撞传递
+        移动一个节点（带动子节点的整体移动）
         """
-        if not SETTING_SERVICE.is_enable_node_collision:
-            return
+        self.move_nodes(self.get_subtree_nodes([node]), d_location)
 
-        for node in self.nodes:
-            if node == self_node:
+    @staticmethod
+    def get_subtree_nodes(roots: Iterable[EntityNode]) -> list[EntityNode]:
+        """
+        获取这些节点以及顺着子节点能走到的所有节点，先序，每个节点只出现一次
+        用栈代替递归，走过的节点记在一个集合里，
+        多条路径汇合到同一个节点（菱形连接）或者有环的时候都只走一次
+        """
+        result: list[EntityNode] = []
+        visited: set[EntityNode] = set()
+        stack = list(roots)
+        stack.reverse()
+        while stack:
+            node = stack.pop()
+            if node in visited:
                 continue
-            if node.body_shape.is_collision(self_node.body_shape):
-                self_node.collide_with(node)
-                self.collide_dfs(node)
+            visited.add(node)
+            result.append(node)
+            # 倒着压栈，出栈的时候就是子节点原本的顺序
+            children = list(node.children)
+            children.reverse()
+            stack.extend(child for child in children if child not in visited)
+        return result
 
     def add_node_by_click(self, location_world: NumberVector) -> EntityNode:
         res = EntityNode(Rectangle(location_world - NumberVector(50, 50), 100, 100))
         self.nodes.append(res)
+        self._uuid_to_node[res.uuid] = res
+        self._node_index.insert(res, res.body_shape)
+        self._set_node_record(res)
+        self._dirty_nodes.add(res)
+        self._damage(res.body_shape)
         return res
 
     def delete_node(self, node: EntityNode):
-        if node in self.nodes:
-            self.nodes.remove(node)
-        # 不仅要删除节点本身，其他节点的child中也要删除该节点
-        for father_node in self.nodes:
-            if node in father_node.children:
-                father_node.children.remove(node)
-        self.update_lines()
+        self.delete_nodes([node])
 
     def delete_nodes(self, nodes: list[EntityNode]):
+        self.deselect_nodes(nodes)
+        deleted_nodes: set[EntityNode] = set()
         for node in nodes:
-            if node in self.nodes:
-                self.nodes.remove(node)
+            if not self.is_node_exist(node):
+                continue
+            deleted_nodes.add(node)
+            del self._uuid_to_node[node.uuid]
+            self._node_index.remove(node)
+            del self._node_records[node]
+            self._mark_snapshot_changed(node=node)
+            self._dirty_nodes.discard(node)
+            self._damage(node.body_shape)
             # 不仅要删除节点本身，其他节点的child中也要删除该节点
-            for father_node in self.nodes:
-                if node in father_node.children:
-                    father_node.children.remove(node)
-        self.update_lines()
+            for edge in [(node, child) for child in node.children] + [
+                (father_node, node) for father_node in node.parents
+            ]:
+                line = self._pop_edge_line(edge)
+                if line is not None:
+                    self._damage_line(line)
+            node.remove_all_connections()
+        if not deleted_nodes:
+            return
+        self._edge_revision += 1
+        self.nodes[:] = [node for node in self.nodes if node not in deleted_nodes]
 
     def connect_node(self, from_node: EntityNode, to_node: EntityNode) -> bool:
-        if from_node in self.nodes and to_node in self.nodes:
+        if self.is_node_exist(from_node) and self.is_node_exist(to_node):
             res = from_node.add_child(to_node)
-            self.update_lines()
+            if res:
+                line = self._get_edge_line(from_node, to_node)
+                self._set_edge_line((from_node, to_node), line)
+                self._damage_line(line)
+                self._edge_revision += 1
             return res
         return False
 
     def disconnect_node(self, from_node: EntityNode, to_node: EntityNode) -> bool:
-        if from_node in self.nodes and to_node in self.nodes:
+        if self.is_node_exist(from_node) and self.is_node_exist(to_node):
             res = from_node.remove_child(to_node)
-            self.update_lines()
+            line = self._pop_edge_line((from_node, to_node))
+            if line is not None:
+                self._damage_line(line)
+                self._edge_revision += 1
             return res
         return False
 
-    def _get_all_lines(self) -> list[Line]:
-        lines = []
-        for node in self.nodes:
-            for child in node.children:
-                connect_line = Line(node.body_shape.center, child.body_shape.center)
-                from_point = node.body_shape.get_line_intersection_point(connect_line)
-                to_point = child.body_shape.get_line_intersection_point(connect_line)
+    @staticmethod
+    def _get_edge_line(node: EntityNode, child: EntityNode) -> Line:
+        """计算一条连线，两端裁剪到节点矩形的边缘上"""
+        connect_line = Line(node.body_shape.center, child.body_shape.center)
+        from_point = node.body_shape.get_line_intersection_point(connect_line)
+        to_point = child.body_shape.get_line_intersection_point(connect_line)
+        return Line(from_point, to_point)
+
+    def _set_edge_line(self, edge: tuple[EntityNode, EntityNode], line: Line):
+        """新增或者更新一条连线的缓存，同时更新连线的空间索引"""
+        self._edge_lines[edge] = line
+        self._edge_index.insert_line(edge, line)
+        self._mark_snapshot_changed(edge=edge)
 
-                lines.append(Line(from_point, to_point))
-        return lines
+    def _replace_edge_line(self, edge: tuple[EntityNode, EntityNode], line: Line):
+        """换成新的连线，新旧连线的位置都要重绘"""
+        old_line = self._edge_lines.get(edge)
+        if old_line is not None:
+            self._damage_line(old_line)
+        self._set_edge_line(edge, line)
+        self._damage_line(line)
 
-    def update_lines(self):
+    def _pop_edge_line(self, edge: tuple[EntityNode, EntityNode]) -> Line | None:
+        """从缓存和空间索引里去掉一条连线，返回去掉的连线，本来就没有返回None"""
+        self._edge_curves.pop(edge, None)
+        self._edge_index.remove(edge)
+        self._mark_snapshot_changed(edge=edge)
+        return self._edge_lines.pop(edge, None)
+
+    def update_dirty_lines(self):
         """
-        注意：此方法不要在外界频繁调用（尤其是循环渲染中），否则可能很卡
-        建议只在必要操作之后调用一下。
+        只重新计算和脏节点相连的线
         """
-        self._lines = self._get_all_lines()
+        if not self._dirty_nodes:
+            return
+        # 两端都是脏节点的线只算一次，整体移动一组节点时组内的连线很多
+        dirty_edges: dict[tuple[EntityNode, EntityNode], None] = {}
+        for node in self._dirty_nodes:
+            dirty_edges.update(dict.fromkeys((node, child) for child in node.children))
+            dirty_edges.update(
+                dict.fromkeys((father_node, node) for father_node in node.parents)
+            )
+        for edge in dirty_edges:
+            self._replace_edge_line(edge, self._get_edge_line(*edge))
+        self._dirty_nodes.clear()
+        self._edge_revision += 1
 
-    def get_all_lines_and_node(self) -> list[tuple[Line, EntityNode, EntityNode]]:
-        lines = []
-        for node in self.nodes:
-            for child in node.children:
-                connect_line = Line(node.body_shape.center, child.body_shape.center)
-                from_point = node.body_shape.get_line_intersection_point(connect_line)
-                to_point = child.body_shape.get_line_intersection_point(connect_line)
+    def lines_intersecting(
+        self, cutting_line: Line
+    ) -> list[tuple[Line, EntityNode, EntityNode]]:
+        """
+        和线段相交的所有连线，用于切割
+        先用连线的空间索引找出外接矩形沿途和线段有重叠的，再逐条判断是否真的相交
+        :return: [(连线, 父节点, 子节点)]
+        """
+        self.update_dirty_lines()
+        result = []
+        for node, child in self._edge_index.query_line(cutting_line):
+            line = self._edge_lines[(node, child)]
+            if line.is_intersecting(cutting_line):
+                result.append((line, node, child))
+        return result
 
-                lines.append((Line(from_point, to_point), node, child))
-        return lines
+    def nodes_intersecting(self, cutting_line: Line) -> list[EntityNode]:
+        """和线段相交的所有节点，用于切割，完全在节点内部的线段不算相交"""
+        return [
+            node
+            for node in self._node_index.query_line(cutting_line)
+            if node.body_shape.is_intersect_with_line(cutting_line)
+        ]
 
     def rotate_node(self, node: EntityNode, degrees: float):
         """
         按照一定角度旋转节点，旋转的是连接这个节点的所有子节点
         也就是如果这个节点没有子节点，那么看上去没有效果
         """
-        self._rotate_node_dfs(node, node, degrees, [])
-        self.update_lines()
+        rotate_center_location = node.body_shape.center
+        # 中心节点自己不用转，子树里的其他节点每个只转一次
+        for current_node in self.get_subtree_nodes([node])[1:]:
+            radius = current_node.body_shape.center.distance_to(rotate_center_location)
+            center_to_child_vector = (
+                current_node.body_shape.center - rotate_center_location
+            ).normalize()
+            center_to_child_vector = center_to_child_vector.rotate(degrees) * radius
+            new_location = rotate_center_location + center_to_child_vector
+            current_node.move_to(
+                new_location
+                - NumberVector(
+                    current_node.body_shape.width / 2,
+                    current_node.body_shape.height / 2,
+                )
+            )
+            self._on_node_shape_changed(current_node)
+
+    def _get_visible_edges(
+        self, view_rect: Rectangle
+    ) -> list[tuple[tuple[EntityNode, EntityNode], Line]]:
+        """获取经过视野附近的连线，返回 [((父节点, 子节点), 连线)]"""
+        return [
+            (edge, self._edge_lines[edge])
+            for edge in self._edge_index.query_rect(view_rect)
+        ]
 
-    def _rotate_node_dfs(
+    def paint(self, context: PaintContext, clip_rect: Rectangle | None = None):
+        """
+        绘制场景：节点本体和连线
+        选中框、详细文字这些经常变化的东西由paint_overlays单独画
+        :param clip_rect: 局部重绘时需要重绘的范围，世界坐标，只画和它有重叠的节点
+                          None表示重绘整个视野
+        """
+        self.update_dirty_lines()
+        # 视野剔除，只画视野范围内的节点和连线
+        view_rect = context.camera.cover_world_rectangle.expand(self.PAINT_CULL_MARGIN)
+        # 连线是按整个视野合并缓存的，局部重绘时也直接用，超出的部分qt会裁掉
+        node_rect = (
+            view_rect if clip_rect is None else clip_rect.expand(self.PAINT_CULL_MARGIN)
+        )
+
+        # 根据缩放比例选择细节层次
+        scale = context.camera.current_scale
+        # 缩小时连线不画箭头和曲线，只画直线
+        is_simple_lines = scale < SETTING_SERVICE.lod_flat_scale
+        if scale < SETTING_SERVICE.lod_block_scale:
+            # 密度色块模式下不逐个画节点，也就不需要查询可见节点
+            self.painted_node_count = 0
+            self.culled_node_count = len(self.nodes)
+            self._paint_node_density_blocks(context, node_rect)
+        else:
+            visible_nodes = self._node_index.query_rect(node_rect)
+            self.painted_node_count = len(visible_nodes)
+            self.culled_node_count = len(self.nodes) - len(visible_nodes)
+            if is_simple_lines:
+                self._paint_nodes_flat(context, visible_nodes)
+            else:
+                # 画节点本身
+                for node in visible_nodes:
+                    node.paint(context)
+        self.paint_edge_paths(
+            context,
+            is_simple_lines,
+            SETTING_SERVICE.line_style,
+            self._get_edge_paths(view_rect, is_simple_lines),
+        )
+
+    def get_snapshot(self) -> SceneSnapshot:
+        """
+        获取当前场景的只读快照，给后台线程绘制用
+        场景版本号没变就返回上一次的快照
+        平时只带上底稿之后改过的节点和连线，改得多了才重新完整复制一份底稿
+        """
+        self.update_dirty_lines()
+        settings = (
+            SETTING_SERVICE.line_style,
+            SETTING_SERVICE.lod_text_scale,
+            SETTING_SERVICE.lod_flat_scale,
+            SETTING_SERVICE.lod_block_scale,
+        )
+        if (
+            self._snapshot is None
+            or self._snapshot.revision != self.scene_revision
+            or self._snapshot.get_settings() != settings
+        ):
+            if self._snapshot_base is None:
+                self._snapshot_base = SceneBase(
+                    self._node_index.copy(),
+                    self._node_records.copy(),
+                    self._edge_index.copy(),
+                    self._edge_lines.copy(),
+                )
+            self._snapshot = SceneSnapshot(
+                self.scene_revision,
+                self._snapshot_base,
+                {
+                    node: self._node_records.get(node)
+                    for node in self._snapshot_changed_nodes
+                },
+                {
+                    edge: self._edge_lines.get(edge)
+                    for edge in self._snapshot_changed_edges
+                },
+                *settings,
+            )
+        return self._snapshot
+
+    def paint_overlays(
         self,
-        rotate_center_node: EntityNode,
-        current_node: EntityNode,
-        degrees: float,
-        visited_uuids: list[str],
+        context: PaintContext,
+        detail_show_nodes: list[EntityNode],
+        clip_rect: Rectangle | None = None,
     ):
-        rotate_center_location = rotate_center_node.body_shape.center
-        # 先旋转自己
-        radius = current_node.body_shape.center.distance_to(rotate_center_location)
-        center_to_child_vector = (
-            current_node.body_shape.center - rotate_center_location
-        ).normalize()
-        center_to_child_vector = center_to_child_vector.rotate(degrees) * radius
-        new_location = rotate_center_location + center_to_child_vector
-        current_node.move_to(
-            new_location
-            - NumberVector(
-                current_node.body_shape.width / 2, current_node.body_shape.height / 2
-            )
+        """
+        绘制叠加在场景上面的部分：选中框、详细文字、游标、待生长的节点
+        这些随着鼠标操作频繁变化，不画进缓存的场景图层里
+        :param detail_show_nodes: 正在显示详细文字的节点
+                                  详细文字可能远远超出节点本身，不按范围查询，全部都画
+        :param clip_rect: 同paint
+        """
+        if context.camera.current_scale >= SETTING_SERVICE.lod_flat_scale:
+            node_rect = (
+                context.camera.cover_world_rectangle if clip_rect is None else clip_rect
+            ).expand(self.PAINT_CULL_MARGIN)
+            overlay_nodes = {
+                node: None
+                for node in self._node_index.query_rect(node_rect)
+                if node.is_selected
+            }
+            overlay_nodes.update(dict.fromkeys(detail_show_nodes))
+            for node in overlay_nodes:
+                node.paint_overlay(context)
+        self._paint_cursor_and_grow_node(context)
+
+    @staticmethod
+    def _snap_cull_rect(view_rect: Rectangle) -> Rectangle:
+        """
+        把视野矩形向外对齐到格子上，格子边长是2的整数次幂
+        视野小范围平移或缩放时对齐后的矩形不变，合并好的连线路径就不用重建
+        """
+        cell_size = 2 ** math.ceil(
+            math.log2(max(view_rect.width, view_rect.height, 1) / 8)
         )
-        # 再旋转子节点
-        for child in current_node.children:
-            if child.uuid in visited_uuids:
-                # 防止出现环形连接，导致无限递归
-                continue
-            self._rotate_node_dfs(
-                rotate_center_node, child, degrees, visited_uuids + [current_node.uuid]
+        return Rectangle.from_edges(
+            math.floor(view_rect.left() / cell_size) * cell_size,
+            math.floor(view_rect.top() / cell_size) * cell_size,
+            math.ceil(view_rect.right() / cell_size) * cell_size,
+            math.ceil(view_rect.bottom() / cell_size) * cell_size,
+        )
+
+    def _get_edge_paths(self, view_rect: Rectangle, is_simple_lines: bool) -> EdgePaths:
+        """
+        获取视野附近所有连线合并成的路径，同一种画法的连线合并成一条路径
+        只有连线变了、画法变了、或者视野移出了对齐后的范围才重建
+        """
+        cull_rect = self._snap_cull_rect(view_rect)
+        cache_key = (
+            self._edge_revision,
+            is_simple_lines,
+            SETTING_SERVICE.line_style,
+            cull_rect.left(),
+            cull_rect.top(),
+            cull_rect.right(),
+            cull_rect.bottom(),
+        )
+        if self._edge_paths_cache is None or self._edge_paths_cache[0] != cache_key:
+            edges = self._get_visible_edges(cull_rect)
+            self._edge_paths_cache = (
+                cache_key,
+                len(edges),
+                self._build_edge_paths(edges, is_simple_lines),
             )
+        self.painted_line_count = self._edge_paths_cache[1]
+        self.culled_line_count = len(self._edge_lines) - self.painted_line_count
+        return self._edge_paths_cache[2]
 
-    def paint(self, context: PaintContext):
-        # 画节点本身
-        for node in self.nodes:
-            node.paint(context)
+    def _get_edge_curve(
+        self, edge: tuple[EntityNode, EntityNode], line: Line
+    ) -> ConnectCurve:
+        """获取连线对应的贝塞尔曲线，端点变了才重新构造"""
+        curve = self._edge_curves.get(edge)
+        if curve is None or curve.start != line.start or curve.end != line.end:
+            curve = ConnectCurve(line.start, line.end)
+            self._edge_curves[edge] = curve
+        return curve
 
-        # 连线
-        context.painter.q_painter().setTransform(
-            context.camera.get_world2view_transform()
+    def _build_edge_paths(
+        self,
+        edges: list[tuple[tuple[EntityNode, EntityNode], Line]],
+        is_simple_lines: bool,
+    ) -> EdgePaths:
+        """把连线合并成路径，见build_edge_paths"""
+        lines = [line for _, line in edges]
+        curves = None
+        if not is_simple_lines and SETTING_SERVICE.line_style == 0:
+            curves = [self._get_edge_curve(edge, line) for edge, line in edges]
+        return self.build_edge_paths(
+            lines, curves, is_simple_lines, SETTING_SERVICE.line_style
         )
-        for line in self._lines:
-            if SETTING_SERVICE.line_style == 0:
-                context.painter.paint_curve(
-                    ConnectCurve(line.start, line.end), QColor(204, 204, 204)
-                )
-            elif SETTING_SERVICE.line_style == 1:
-                PainterUtils.paint_arrow(
-                    context.painter.q_painter(),
-                    line.start,
-                    line.end,
-                    QColor(204, 204, 204),
-                    4,
-                    30,
+
+    @classmethod
+    def build_edge_paths(
+        cls,
+        lines: list[Line],
+        curves: list[ConnectCurve] | None,
+        is_simple_lines: bool,
+        line_style: int,
+    ) -> EdgePaths:
+        """
+        把连线合并成路径，世界坐标
+        :param curves: 和lines一一对应的贝塞尔曲线，只有贝塞尔画法才需要
+        :return: (描边的路径, 填充的路径)
+                 简化画法：[直线]；贝塞尔：[每条曲线], [箭头...]；直线：[带箭头的直线]
+        """
+        if is_simple_lines:
+            path = QPainterPath()
+            for line in lines:
+                path.moveTo(line.start.to_qt())
+                path.lineTo(line.end.to_qt())
+            return [path], []
+        if line_style == 0:
+            assert curves is not None
+            # 曲线不合并：很多条曲线放在一条路径里做抗锯齿描边，要处理大量自相交，
+            # 交叉越多越慢，反而比一条一条画慢一个数量级
+            arrow_paths: list[QPainterPath] = []
+            for i, curve in enumerate(curves):
+                if i % cls.ARROW_PATH_BATCH_SIZE == 0:
+                    arrow_paths.append(QPainterPath())
+                    # 箭头互相重叠的地方也要填满
+                    arrow_paths[-1].setFillRule(Qt.FillRule.WindingFill)
+                arrow_paths[-1].addPath(curve.arrow.path)
+            return [curve.path for curve in curves], arrow_paths
+        path = QPainterPath()
+        for line in lines:
+            # 和PainterUtils.paint_arrow画出来的一样：线身加两片箭头
+            end = line.end
+            direction = NumberVector.from_two_points(line.start, end).normalize()
+            for start in (
+                line.start,
+                end - direction.rotate(20) * 30,
+                end - direction.rotate(-20) * 30,
+            ):
+                path.moveTo(QPointF(int(start.x), int(start.y)))
+                path.lineTo(QPointF(int(end.x), int(end.y)))
+        return [path], []
+
+    @staticmethod
+    def paint_edge_paths(
+        context: PaintContext,
+        is_simple_lines: bool,
+        line_style: int,
+        paths: EdgePaths,
+    ):
+        """画build_edge_paths合并好的连线路径"""
+        stroke_paths, fill_paths = paths
+        painter = context.painter.q_painter()
+        painter.setTransform(context.camera.get_world2view_transform())
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        if is_simple_lines:
+            pen = QPen(QColor(204, 204, 204, 128), 1)
+            # 线宽不随缩放变化，始终一个像素
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPath(stroke_paths[0])
+        elif line_style == 0:
+            # 贝塞尔曲线，画法和ProjectGraphPainter.paint_curve一样
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(QPen(QColor(204, 204, 204), 2))
+            for curve_path in stroke_paths:
+                painter.drawPath(curve_path)
+            painter.setBrush(QColor(204, 204, 204))
+            for arrow_path in fill_paths:
+                painter.drawPath(arrow_path)
+            painter.setRenderHint(QPainter.Antialiasing, False)
+        else:
+            painter.setPen(QPen(QColor(204, 204, 204), 4))
+            painter.drawPath(stroke_paths[0])
+        painter.resetTransform()
+
+    def _paint_nodes_flat(self, context: PaintContext, nodes: list[EntityNode]):
+        """缩小时把节点画成纯色矩形，同色的节点一次画完"""
+        rects_by_color: dict[int, list[QRectF]] = {}
+        for node in nodes:
+            rects_by_color.setdefault(node.color.rgba(), []).append(
+                QRectF(
+                    node.body_shape.location_left_top.x,
+                    node.body_shape.location_left_top.y,
+                    node.body_shape.width,
+                    node.body_shape.height,
                 )
+            )
+        self.paint_flat_rects(context, rects_by_color)
+
+    @staticmethod
+    def paint_flat_rects(
+        context: PaintContext, rects_by_color: dict[int, list[QRectF]]
+    ):
+        """
+        画纯色矩形，世界坐标
+        :param rects_by_color: 颜色rgba -> 这个颜色的所有矩形
+        """
+        painter = context.painter.q_painter()
+        painter.setTransform(context.camera.get_world2view_transform())
+        painter.setPen(Qt.PenStyle.NoPen)
+        for rgba, rects in rects_by_color.items():
+            painter.setBrush(QColor.fromRgba(rgba))
+            painter.drawRects(*rects)
+        painter.resetTransform()
+
+    def _paint_node_density_blocks(self, context: PaintContext, view_rect: Rectangle):
+        """
+        缩得非常小时不再逐个画节点，而是把空间索引的格子合并成屏幕上的色块，
+        节点越密集的色块越不透明
+        """
+        cell_size = self._node_index.cell_size
+        self.paint_density_blocks(
+            context,
+            self.merge_density_cells(
+                self._node_index.count_cells(view_rect),
+                self.get_density_merge(cell_size, context.camera.current_scale),
+            ),
+            cell_size,
+        )
+
+    @classmethod
+    def get_density_merge(cls, cell_size: float, scale: float) -> int:
+        """至少要把多少个格子合成一个色块，色块才不会小于DENSITY_BLOCK_SIZE像素"""
+        return max(1, int(cls.DENSITY_BLOCK_SIZE / (cell_size * scale)))
+
+    @staticmethod
+    def merge_density_cells(
+        cell_counts: list[tuple[int, int, int]], merge: int
+    ) -> dict[tuple[int, int], int]:
+        """
+        把空间索引的格子合并成色块
+        :param cell_counts: SpatialHash.count_cells的结果
+        :return: (色块x, 色块y) -> 色块里的节点数量
+        """
+        block_counts: dict[tuple[int, int], int] = {}
+        for cx, cy, count in cell_counts:
+            key = (cx // merge, cy // merge)
+            block_counts[key] = block_counts.get(key, 0) + count
+        return block_counts
+
+    @classmethod
+    def paint_density_blocks(
+        cls,
+        context: PaintContext,
+        block_counts: dict[tuple[int, int], int],
+        cell_size: float,
+        max_count: int | None = None,
+    ):
+        """
+        画节点密度色块
+        :param block_counts: merge_density_cells的结果
+        :param max_count: 最密的色块里有多少节点，决定透明度的档位，None表示按block_counts自己算
+        """
+        if not block_counts:
+            return
+        if max_count is None:
+            max_count = max(block_counts.values())
+        merge = cls.get_density_merge(cell_size, context.camera.current_scale)
+        # 按透明度分成几档，每档一次画完
+        levels = 4
+        rects_by_level: list[list[QRectF]] = [[] for _ in range(levels)]
+        block_size = cell_size * merge
+        for (bx, by), count in block_counts.items():
+            level = min(levels - 1, count * levels // (max_count + 1))
+            rects_by_level[level].append(
+                QRectF(bx * block_size, by * block_size, block_size, block_size)
+            )
+        painter = context.painter.q_painter()
+        painter.setTransform(context.camera.get_world2view_transform())
+        painter.setPen(Qt.PenStyle.NoPen)
+        for level, rects in enumerate(rects_by_level):
+            if rects:
+                painter.setBrush(QColor(204, 204, 204, 60 + level * 50))
+                painter.drawRects(*rects)
+        painter.resetTransform()
 
-        context.painter.q_painter().resetTransform()
+    def _paint_cursor_and_grow_node(self, context: PaintContext):
         # 画游标
         if self.cursor_node is not None:
             margin = 10
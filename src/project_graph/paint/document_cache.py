@@ -0,0 +1,73 @@
+"""
+排好版的多行文本（QTextDocument）缓存
+详细文字可能有好几KB，每帧都重新setHtml排版非常慢，所以按照
+(文字内容, 宽度, 字体大小, 颜色) 缓存起来，只保留最近显示过的一部分
+"""
+
+from collections import OrderedDict
+
+from PyQt5.QtGui import QColor, QTextDocument
+
+from project_graph.paint.paint_utils import PainterUtils
+
+
+class DocumentCache:
+    """
+    最近使用的排好版的多行文本，超过容量时丢掉最久没用过的
+    宽度和字体大小都取整，相当于按缩放档位缓存
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        """最多缓存多少个排好版的文本"""
+
+        self._documents: OrderedDict[tuple[str, int, int, int], QTextDocument] = (
+            OrderedDict()
+        )
+        """(文字内容, 宽度, 字体大小, 颜色) -> 排好版的文本，越靠后越是最近用过的"""
+
+        self._keys_by_text: dict[str, set[tuple[str, int, int, int]]] = {}
+        """文字内容 -> 这段文字在缓存里的所有key，文字被修改时用来删除旧的排版"""
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def get(
+        self, text: str, text_width: float, font_size: float, text_color: QColor
+    ) -> QTextDocument:
+        """获取排好版的文本，没有缓存就现场排版"""
+        key = (text, int(text_width), int(font_size), text_color.rgba())
+        document = self._documents.get(key)
+        if document is not None:
+            self._documents.move_to_end(key)
+            return document
+
+        document, _ = PainterUtils.create_document(
+            text, int(text_width), int(font_size), text_color
+        )
+        self._documents[key] = document
+        self._keys_by_text.setdefault(text, set()).add(key)
+        while len(self._documents) > self.capacity:
+            old_key, _ = self._documents.popitem(last=False)
+            self._forget_key(old_key)
+        return document
+
+    def discard_text(self, text: str):
+        """文字被修改了，丢掉这段旧文字的所有排版"""
+        for key in self._keys_by_text.pop(text, ()):
+            self._documents.pop(key, None)
+
+    def clear(self):
+        self._documents.clear()
+        self._keys_by_text.clear()
+
+    def _forget_key(self, key: tuple[str, int, int, int]):
+        keys = self._keys_by_text.get(key[0])
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_text[key[0]]
+
+
+DOCUMENT_CACHE = DocumentCache()
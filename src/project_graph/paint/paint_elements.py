@@ -1,3 +1,6 @@
+import math
+
+from PyQt5.QtCore import QLine
 from PyQt5.QtGui import QColor, QPainter
 
 from project_graph.camera import Camera
@@ -6,28 +9,63 @@ from project_graph.data_struct.rectangle import Rectangle
 from project_graph.logging import log
 from project_graph.paint.paint_utils import PainterUtils
 
+GRID_BASE_SPACING = 100
+"""网格的基础间距，世界坐标"""
+
+GRID_MIN_VIEW_SPACING = 50
+"""网格线之间在屏幕上最少隔多少像素，缩小时网格会自动变稀疏"""
+
+
+def get_grid_spacing(scale: float) -> float:
+    """
+    根据缩放比例选择网格间距，保证屏幕上的间距在 [GRID_MIN_VIEW_SPACING, 4倍) 之间
+    间距总是基础间距乘以2的整数次幂，这样缩放时网格线不会乱跳
+    """
+    spacing = GRID_BASE_SPACING
+    while spacing * scale < GRID_MIN_VIEW_SPACING:
+        spacing *= 2
+    while spacing * scale >= GRID_MIN_VIEW_SPACING * 4:
+        spacing /= 2
+    return spacing
+
 
 def paint_grid(paint: QPainter, camera: Camera):
+    """
+    只画视野范围内的网格线，间距随缩放自动调整，所有线一次性批量绘制
+    """
     try:
         line_color = QColor(255, 255, 255, 50)
         line_color_light = QColor(255, 255, 255, 100)
 
-        for y in range(-1000, 1000, 100):
-            PainterUtils.paint_solid_line(
-                paint,
-                camera.location_world2view(NumberVector(-1000, y)),
-                camera.location_world2view(NumberVector(1000, y)),
-                line_color_light if y == 0 else line_color,
-                1 * camera.current_scale,
+        scale = camera.current_scale
+        spacing = get_grid_spacing(scale)
+        world_rect = camera.cover_world_rectangle
+        left_top = camera.location_world2view(world_rect.location_left_top)
+        # 视野坐标下的四条边，网格线画满整个视野
+        view_left, view_top = int(left_top.x), int(left_top.y)
+        view_right = int(left_top.x + world_rect.width * scale)
+        view_bottom = int(left_top.y + world_rect.height * scale)
+        origin = camera.location_world2view(NumberVector(0, 0))
+
+        lines: list[QLine] = []
+        axis_lines: list[QLine] = []
+        y_start = math.floor(world_rect.top() / spacing)
+        y_end = math.ceil(world_rect.bottom() / spacing)
+        for i in range(y_start, y_end + 1):
+            view_y = int(origin.y + i * spacing * scale)
+            (axis_lines if i == 0 else lines).append(
+                QLine(view_left, view_y, view_right, view_y)
             )
-        for x in range(-1000, 1000, 100):
-            PainterUtils.paint_solid_line(
-                paint,
-                camera.location_world2view(NumberVector(x, -1000)),
-                camera.location_world2view(NumberVector(x, 1000)),
-                line_color_light if x == 0 else line_color,
-                1 * camera.current_scale,
+        x_start = math.floor(world_rect.left() / spacing)
+        x_end = math.ceil(world_rect.right() / spacing)
+        for i in range(x_start, x_end + 1):
+            view_x = int(origin.x + i * spacing * scale)
+            (axis_lines if i == 0 else lines).append(
+                QLine(view_x, view_top, view_x, view_bottom)
             )
+
+        PainterUtils.paint_solid_lines(paint, lines, line_color, 1 * scale)
+        PainterUtils.paint_solid_lines(paint, axis_lines, line_color_light, 1 * scale)
     except Exception as e:
         log(e)
 
@@ -4,22 +4,27 @@
 
 import traceback
 
-from PyQt5.QtCore import QPoint, QPointF, QRectF, QSizeF, Qt
+from PyQt5.QtCore import QLine, QPoint, QPointF, QRectF, QSizeF, Qt
 from PyQt5.QtGui import (
     QColor,
-    QFont,
-    QFontMetrics,
-    QImage,
     QPainter,
     QPainterPath,
     QPen,
+    QStaticText,
     QTextDocument,
+    QTransform,
 )
 
 from project_graph.data_struct.circle import Circle
 from project_graph.data_struct.number_vector import NumberVector
 from project_graph.data_struct.rectangle import Rectangle
 from project_graph.logging import log
+from project_graph.tools.font_tools import (
+    DEFAULT_FONT_FAMILY,
+    get_font,
+    get_font_metrics,
+)
+from project_graph.tools.image_tools import get_scaled_pixmap
 
 
 class PainterUtils:
@@ -73,6 +78,23 @@ class PainterUtils:
         # painter.setRenderHint(QPainter.Antialiasing, False)
         pass
 
+    @staticmethod
+    def paint_solid_lines(
+        painter: QPainter,
+        lines: list[QLine],
+        color: QColor,
+        width: float,
+    ):
+        """
+        一次性绘制一批同样颜色、同样粗细的实线，比逐条调用paint_solid_line快很多
+        :param lines: 视野坐标下的线段
+        """
+        if not lines:
+            return
+        painter.setPen(QPen(color, width))
+        painter.setBrush(color)
+        painter.drawLines(*lines)
+
     @staticmethod
     def paint_dashed_line(
         painter: QPainter,
@@ -242,12 +264,10 @@ class PainterUtils:
         :param color:
         :return:
         """
-        # 创建QFont对象并设置字体大小
+        # 获取缓存的QFont对象和字体度量信息
         try:
-            font = QFont("Times New Roman")
-            font.setPointSizeF(font_size)
-            # 获取字体度量信息
-            font_metrics = QFontMetrics(font)
+            font = get_font(DEFAULT_FONT_FAMILY, font_size)
+            font_metrics = get_font_metrics(DEFAULT_FONT_FAMILY, font_size)
             # 设置QPainter的字体和颜色
             painter.setFont(font)
             painter.setPen(color)
@@ -299,9 +319,8 @@ class PainterUtils:
         :return: None
         """
         try:
-            font = QFont("Times New Roman")
-            font.setPointSize(int(font_size))
-            font_metrics = QFontMetrics(font)
+            font = get_font(DEFAULT_FONT_FAMILY, int(font_size))
+            font_metrics = get_font_metrics(DEFAULT_FONT_FAMILY, int(font_size))
 
             # 设置QPainter的字体和颜色
             painter.setFont(font)
@@ -335,24 +354,60 @@ class PainterUtils:
             return 0, 0
 
     @staticmethod
-    def paint_document_from_left_top(
+    def create_static_text(text: str, font_size: int) -> tuple[QStaticText, int]:
+        """
+        创建一个提前排好版的单行文本，可以缓存起来，配合paint_static_text_from_center反复绘制
+        :param font_size: 字体大小，和paint_text_from_center一样会被取整
+        :return: (排好版的文本, 文本宽度)
+        """
+        font_size = int(font_size)
+        static_text = QStaticText(text)
+        static_text.setTextFormat(Qt.TextFormat.PlainText)
+        static_text.prepare(QTransform(), get_font(DEFAULT_FONT_FAMILY, font_size))
+        # 宽度用和paint_text_from_center一样的算法，保证两种画法位置一致
+        text_width = get_font_metrics(DEFAULT_FONT_FAMILY, font_size).width(text)
+        return static_text, text_width
+
+    @staticmethod
+    def paint_static_text_from_center(
         painter: QPainter,
-        location: NumberVector,
-        text: str,
-        text_width: float,
-        font_size: float,
-        text_color: QColor,
-        background_color: QColor,
-    ) -> Rectangle:
+        center: NumberVector,
+        static_text: QStaticText,
+        text_width: int,
+        font_size: int,
+        color: QColor,
+    ):
         """
-        document 是可以换行的多行文本
-        text 传入的是html字符串
-        最终返回的Rectangle是文本的矩形大小，视野坐标
+        绘制一个排好版的文本，效果和paint_text_from_center一样，但不用每次都重新排版
+        :param text_width: create_static_text返回的文本宽度
+        :param font_size: 必须和创建static_text时的字体大小一致
         """
-        # 创建新的坐标
+        font_size = int(font_size)
+        font_metrics = get_font_metrics(DEFAULT_FONT_FAMILY, font_size)
+        painter.setFont(get_font(DEFAULT_FONT_FAMILY, font_size))
+        painter.setPen(color)
+        center = center.integer()
+        text_height = font_metrics.height()
+        # drawStaticText 传入的是文字的左上角，不是基线
+        painter.drawStaticText(
+            QPoint(
+                int(center.x) - text_width // 2,
+                int(center.y) - text_height // 2,
+            ),
+            static_text,
+        )
 
+    @staticmethod
+    def create_document(
+        text: str, text_width: float, font_size: float, text_color: QColor
+    ) -> tuple[QTextDocument, float]:
+        """
+        创建一个排好版的多行文本，可以缓存起来，配合paint_document反复绘制
+        text 传入的是html字符串
+        :return: (document, 文本高度)
+        """
         # 设置字体和颜色
-        font = QFont("Times New Roman", int(font_size))
+        font = get_font(DEFAULT_FONT_FAMILY, int(font_size))
         # 使用QTextDocument绘制文本
         document = QTextDocument()
         text = text.replace("\n", "<br>")
@@ -363,6 +418,40 @@ class PainterUtils:
         css = f"body {{ color: {text_color.name()}; }}"
         document.setDefaultStyleSheet(css)
         document.setDefaultFont(font)
+        return document, h
+
+    @staticmethod
+    def paint_document(
+        painter: QPainter, location: NumberVector, document: QTextDocument
+    ):
+        """
+        绘制一个create_document创建好的多行文本，location是左上角
+        """
+        location = QPointF(int(location.x), int(location.y))
+        # 调整坐标
+        painter.translate(location)
+        # 这个可能只是一个矩形遮罩
+        document.drawContents(painter, QRectF(QPointF(0, 0), QSizeF(5000, 5000)))
+        painter.translate(-location)
+
+    @staticmethod
+    def paint_document_from_left_top(
+        painter: QPainter,
+        location: NumberVector,
+        text: str,
+        text_width: float,
+        font_size: float,
+        text_color: QColor,
+        background_color: QColor,
+    ) -> Rectangle:
+        """
+        document 是可以换行的多行文本
+        text 传入的是html字符串
+        最终返回的Rectangle是文本的矩形大小，视野坐标
+        """
+        document, h = PainterUtils.create_document(
+            text, text_width, font_size, text_color
+        )
 
         # 画背景  # 太奇怪了，高度不确定
         # PainterUtils.paint_rect(
@@ -372,15 +461,10 @@ class PainterUtils:
         #     h,
         #     background_color,
         # )
-        location = QPointF(int(location.x), int(location.y))
-        # 调整坐标
-        painter.translate(location)
-        # 这个可能只是一个矩形遮罩
-        document.drawContents(painter, QRectF(QPointF(0, 0), QSizeF(5000, 5000)))
-        painter.translate(-location)
+        PainterUtils.paint_document(painter, location, document)
 
         return Rectangle(
-            NumberVector(location.x(), location.y()), width=text_width, height=h
+            NumberVector(int(location.x), int(location.y)), width=text_width, height=h
         )
 
     @staticmethod
@@ -400,10 +484,14 @@ class PainterUtils:
         :param height:
         :return:
         """
-        # 加载图片
-        image = QImage(image_path)
-        # 缩放图片
-        image = image.scaled(int(width), int(height))
-        # 绘制图片
-        painter.drawImage(int(left_top.x), int(left_top.y), image)
+        # 缩放好的图片是缓存的，这里只需要贴图
+        # painter没有开始绘制时拿不到绘制设备，按1倍缩放处理
+        device = painter.device()
+        pixmap = get_scaled_pixmap(
+            image_path,
+            int(width),
+            int(height),
+            device.devicePixelRatioF() if device is not None else 1.0,
+        )
+        painter.drawPixmap(int(left_top.x), int(left_top.y), pixmap)
         pass
@@ -0,0 +1,221 @@
+"""
+场景快照
+后台线程绘制场景时不能直接读节点管理器，因为界面线程随时可能在改节点和连线，
+所以先在界面线程里把绘制需要的数据拷贝一份，后台线程只读这份拷贝。
+节点很多时每改一下就整个拷贝一遍太慢，所以快照分成两层：
+偶尔完整复制一次的底稿（SceneBase），加上底稿之后改过的那些节点和连线。
+"""
+
+import threading
+from typing import Iterable
+
+from project_graph.data_struct.line import Line
+from project_graph.data_struct.number_vector import NumberVector
+from project_graph.data_struct.rectangle import Rectangle
+from project_graph.data_struct.spatial_hash import SpatialHash
+from project_graph.entity.entity_node import EntityNode
+
+NodeRecord = tuple[float, float, float, float, str, int]
+"""(左, 上, 宽, 高, 文字, 颜色rgba)"""
+
+Edge = tuple[EntityNode, EntityNode]
+"""(父节点, 子节点)"""
+
+
+class SceneBase:
+    """
+    快照的底稿，某一时刻所有节点和连线的完整副本，创建之后不再变化
+    空间索引直接用NodeManager里的索引写时复制出来的副本，不用重新建立
+    """
+
+    def __init__(
+        self,
+        node_index: SpatialHash[EntityNode],
+        node_records: dict[EntityNode, NodeRecord],
+        edge_index: SpatialHash[Edge],
+        edge_lines: dict[Edge, Line],
+    ):
+        self.node_index = node_index
+        """节点的空间索引，登记的物体是node_records的键"""
+        self.node_records = node_records
+        """节点 -> 绘制需要的数据，后台线程只拿节点当键用，不读节点本身"""
+        self.edge_index = edge_index
+        """连线的空间索引，登记的物体是edge_lines的键"""
+        self.edge_lines = edge_lines
+        """连线 -> 裁剪好的线段"""
+
+        self._lock = threading.Lock()
+        self._bounds: Rectangle | None = None
+        """所有节点的外接矩形，第一次用到时才算"""
+
+    def __len__(self) -> int:
+        """底稿里节点和连线的总数"""
+        return len(self.node_records) + len(self.edge_lines)
+
+    def get_bounds(self) -> Rectangle:
+        """所有节点的外接矩形，没有节点时是一个点"""
+        with self._lock:
+            if self._bounds is None:
+                self._bounds = _get_records_bounds(self.node_records.values())
+            return self._bounds
+
+
+class SceneSnapshot:
+    """
+    某一时刻场景的只读副本
+    创建之后内容不再变化，多个线程可以同时读
+    由底稿和底稿之后改过的节点、连线组成，查询时改过的以后者为准
+    """
+
+    def __init__(
+        self,
+        revision: int,
+        base: SceneBase,
+        changed_nodes: dict[EntityNode, NodeRecord | None],
+        changed_edges: dict[Edge, Line | None],
+        line_style: int,
+        lod_text_scale: float,
+        lod_flat_scale: float,
+        lod_block_scale: float,
+    ):
+        """
+        :param changed_nodes: 底稿之后改过的节点 -> 现在的样子，已经删掉的是None
+        :param changed_edges: 底稿之后改过的连线 -> 现在的线段，已经删掉的是None
+        """
+        self.revision = revision
+        """创建快照时NodeManager.scene_revision的值"""
+        self._base = base
+        self._changed_nodes = changed_nodes
+        self._changed_edges = changed_edges
+        self.node_cell_size = base.node_index.cell_size
+        """节点空间索引的格子边长，和NodeManager里的一致，密度色块才能对得上"""
+
+        # 改过的节点和连线不多，在这里建好它们自己的小索引
+        self._new_node_records: dict[EntityNode, NodeRecord] = {}
+        self._new_node_index: SpatialHash[EntityNode] = SpatialHash(self.node_cell_size)
+        """改过的节点现在的位置"""
+        self._old_node_index: SpatialHash[EntityNode] = SpatialHash(self.node_cell_size)
+        """改过的节点在底稿里的位置，统计格子里的节点数量时要从底稿里减掉"""
+        for node, record in changed_nodes.items():
+            old_bounds = base.node_index.get_bounds(node)
+            if old_bounds is not None:
+                self._old_node_index.insert(node, old_bounds)
+            if record is not None:
+                self._new_node_records[node] = record
+                self._new_node_index.insert(node, _get_record_rect(record))
+        self._new_edge_lines: dict[Edge, Line] = {}
+        self._new_edge_index: SpatialHash[Edge] = SpatialHash(base.edge_index.cell_size)
+        """改过的连线现在的位置"""
+        for edge, line in changed_edges.items():
+            if line is not None:
+                self._new_edge_lines[edge] = line
+                self._new_edge_index.insert_line(edge, line)
+
+        # 绘制相关的设置也拷贝下来，后台线程不读全局设置
+        self.line_style = line_style
+        self.lod_text_scale = lod_text_scale
+        self.lod_flat_scale = lod_flat_scale
+        self.lod_block_scale = lod_block_scale
+
+        self._lock = threading.Lock()
+        """保护下面这些第一次用到时才统计的数据"""
+        self._max_block_counts: dict[int, int] = {}
+        """色块合并的格子数 -> 整个场景最密的色块里有多少节点，让每一块画出来的深浅一致"""
+
+    def get_settings(self) -> tuple[int, float, float, float]:
+        """拷贝下来的绘制设置，和创建快照时的参数顺序一致"""
+        return (
+            self.line_style,
+            self.lod_text_scale,
+            self.lod_flat_scale,
+            self.lod_block_scale,
+        )
+
+    def query_nodes(self, rect: Rectangle) -> list[NodeRecord]:
+        """外接矩形和rect有重叠的节点"""
+        base_records = self._base.node_records
+        result = [
+            base_records[node]
+            for node in self._base.node_index.query_rect(rect)
+            if node not in self._changed_nodes
+        ]
+        result.extend(
+            self._new_node_records[node]
+            for node in self._new_node_index.query_rect(rect)
+        )
+        return result
+
+    def query_edges(self, rect: Rectangle) -> list[Line]:
+        """经过rect附近、外接矩形和rect有重叠的连线"""
+        base_lines = self._base.edge_lines
+        result = [
+            base_lines[edge]
+            for edge in self._base.edge_index.query_rect(rect)
+            if edge not in self._changed_edges
+        ]
+        result.extend(
+            self._new_edge_lines[edge] for edge in self._new_edge_index.query_rect(rect)
+        )
+        return result
+
+    def count_node_cells(self, rect: Rectangle) -> list[tuple[int, int, int]]:
+        """同SpatialHash.count_cells"""
+        counts: dict[tuple[int, int], int] = {}
+        for cx, cy, count in self._base.node_index.count_cells(rect):
+            counts[(cx, cy)] = count
+        for cx, cy, count in self._old_node_index.count_cells(rect):
+            counts[(cx, cy)] -= count
+        for cx, cy, count in self._new_node_index.count_cells(rect):
+            counts[(cx, cy)] = counts.get((cx, cy), 0) + count
+        return [(cx, cy, count) for (cx, cy), count in counts.items() if count > 0]
+
+    def get_max_block_count(self, merge: int) -> int:
+        """整个场景里，每merge*merge个格子合成的色块中，最多的节点数量"""
+        with self._lock:
+            max_count = self._max_block_counts.get(merge)
+        if max_count is not None:
+            return max_count
+        block_counts: dict[tuple[int, int], int] = {}
+        for cx, cy, count in self.count_node_cells(self.get_bounds()):
+            key = (cx // merge, cy // merge)
+            block_counts[key] = block_counts.get(key, 0) + count
+        max_count = max(block_counts.values(), default=0)
+        with self._lock:
+            self._max_block_counts[merge] = max_count
+        return max_count
+
+    def get_bounds(self) -> Rectangle:
+        """
+        所有节点的外接矩形，没有节点时是一个点
+        底稿之后删掉或者移走的节点原来的位置也算在里面，只会偏大
+        """
+        if not self._new_node_records:
+            return self._base.get_bounds()
+        if not self._base.node_records:
+            return _get_records_bounds(self._new_node_records.values())
+        bounds = self._base.get_bounds()
+        new_bounds = _get_records_bounds(self._new_node_records.values())
+        return Rectangle.from_edges(
+            min(bounds.left(), new_bounds.left()),
+            min(bounds.top(), new_bounds.top()),
+            max(bounds.right(), new_bounds.right()),
+            max(bounds.bottom(), new_bounds.bottom()),
+        )
+
+
+def _get_record_rect(record: NodeRecord) -> Rectangle:
+    left, top, width, height, _, _ = record
+    return Rectangle(NumberVector(left, top), width, height)
+
+
+def _get_records_bounds(records: Iterable[NodeRecord]) -> Rectangle:
+    """一批节点的外接矩形，没有节点时是一个点"""
+    records = list(records)
+    if not records:
+        return Rectangle(NumberVector.zero(), 0, 0)
+    return Rectangle.from_edges(
+        min(record[0] for record in records),
+        min(record[1] for record in records),
+        max(record[0] + record[2] for record in records),
+        max(record[1] + record[3] for record in records),
+    )
@@ -0,0 +1,365 @@
+"""
+分块后台绘制场景
+把世界平面按当前缩放切成固定像素大小的图块，图块在线程池里画到QImage上，
+界面线程只负责把画好的图块贴到屏幕上，节点再多也不会卡住鼠标键盘的响应。
+后台线程只读场景快照（SceneSnapshot），不碰节点管理器。
+"""
+
+import math
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from PyQt5.QtCore import QPoint, QRect, QRectF, Qt
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QImage, QPainter
+
+from project_graph.camera import Camera
+from project_graph.data_struct.curve import ConnectCurve
+from project_graph.data_struct.number_vector import NumberVector
+from project_graph.data_struct.rectangle import Rectangle
+from project_graph.entity.entity_node import EntityNode
+from project_graph.logging import log
+from project_graph.node_manager import NodeManager
+from project_graph.paint.paintables import PaintContext
+from project_graph.paint.painters import ProjectGraphPainter
+from project_graph.paint.scene_snapshot import SceneSnapshot
+from project_graph.tools.font_tools import DEFAULT_FONT_FAMILY
+
+TileKey = tuple[float, float, int, int]
+"""(缩放比例, 设备像素比, 图块x, 图块y)，前两项相同的图块属于同一个缩放层级"""
+
+
+def render_tile(snapshot: SceneSnapshot, key: TileKey, tile_size: int) -> QImage:
+    """
+    把快照中落在这个图块里的节点和连线画到一张透明的QImage上
+    在后台线程里运行，只能用快照里的数据，字体也要自己创建，不能用共享的字体缓存
+    """
+    scale, device_pixel_ratio, tx, ty = key
+    image = QImage(
+        int(tile_size * device_pixel_ratio),
+        int(tile_size * device_pixel_ratio),
+        QImage.Format.Format_ARGB32_Premultiplied,
+    )
+    image.setDevicePixelRatio(device_pixel_ratio)
+    image.fill(Qt.GlobalColor.transparent)
+
+    # 每个图块用一个只看得到这个图块的相机，这样可以直接复用节点和连线的画法
+    tile_world_size = tile_size / scale
+    camera = Camera(
+        NumberVector((tx + 0.5) * tile_world_size, (ty + 0.5) * tile_world_size),
+        tile_size,
+        tile_size,
+    )
+    camera.current_scale = scale
+    camera.target_scale = scale
+    rect = camera.cover_world_rectangle.expand(NodeManager.PAINT_CULL_MARGIN)
+
+    painter = QPainter(image)
+    context = PaintContext(ProjectGraphPainter(painter), camera, NumberVector.zero())
+    is_simple_lines = scale < snapshot.lod_flat_scale
+    if scale < snapshot.lod_block_scale:
+        merge = NodeManager.get_density_merge(snapshot.node_cell_size, scale)
+        NodeManager.paint_density_blocks(
+            context,
+            NodeManager.merge_density_cells(snapshot.count_node_cells(rect), merge),
+            snapshot.node_cell_size,
+            snapshot.get_max_block_count(merge),
+        )
+    elif is_simple_lines:
+        rects_by_color: dict[int, list[QRectF]] = {}
+        for left, top, width, height, _, rgba in snapshot.query_nodes(rect):
+            rects_by_color.setdefault(rgba, []).append(QRectF(left, top, width, height))
+        NodeManager.paint_flat_rects(context, rects_by_color)
+    else:
+        _paint_node_records(context, snapshot, snapshot.query_nodes(rect))
+
+    lines = snapshot.query_edges(rect)
+    curves = None
+    if not is_simple_lines and snapshot.line_style == 0:
+        # 曲线在后台线程里自己构造，界面线程缓存的曲线路径不跨线程共用
+        curves = [ConnectCurve(line.start, line.end) for line in lines]
+    NodeManager.paint_edge_paths(
+        context,
+        is_simple_lines,
+        snapshot.line_style,
+        NodeManager.build_edge_paths(
+            lines, curves, is_simple_lines, snapshot.line_style
+        ),
+    )
+    painter.end()
+    return image
+
+
+def _paint_node_records(
+    context: PaintContext,
+    snapshot: SceneSnapshot,
+    nodes: list[tuple[float, float, float, float, str, int]],
+):
+    """逐个画节点，和EntityNode.paint画出来的一样"""
+    scale = context.camera.current_scale
+    painter = context.painter.q_painter()
+    font_size = int(EntityNode.FONT_SIZE * scale)
+    # 缩得太小不显示文字时是None
+    font_metrics = None
+    if scale >= snapshot.lod_text_scale and font_size > 0:
+        font = QFont(DEFAULT_FONT_FAMILY)
+        font.setPointSizeF(font_size)
+        font_metrics = QFontMetrics(font)
+        painter.setFont(font)
+    for left, top, width, height, text, rgba in nodes:
+        body_shape = Rectangle(NumberVector(left, top), width, height)
+        color = QColor.fromRgba(rgba)
+        EntityNode.paint_frame(context, body_shape, color)
+        if font_metrics is None:
+            continue
+        # 和PainterUtils.paint_text_from_center的算法一样，只是字体不从共享缓存里取
+        center = context.camera.location_world2view(body_shape.center).integer()
+        painter.setPen(color)
+        painter.drawText(
+            QPoint(
+                int(center.x) - font_metrics.width(text) // 2,
+                int(center.y) - font_metrics.height() // 2 + font_metrics.ascent(),
+            ),
+            text,
+        )
+
+
+class TileRenderer:
+    """
+    分块后台绘制场景，图块按缩放层级缓存，超过容量时丢掉最久没用过的
+    只在界面线程里调用，后台线程的结果通过poll取回
+    """
+
+    TILE_SIZE = 256
+    """图块边长，像素"""
+
+    PYRAMID_LEVELS_PER_OCTAVE = 2
+    """
+    预览用的图块金字塔每放大一倍分几层
+    相机移动时不按当前缩放比例画，而是用最接近的金字塔层级的图块拉伸一下顶上
+    """
+
+    FALLBACK_LEVEL_COUNT = 2
+    """图块还没画好的地方，最多拿几个别的缩放层级的图块拉伸了先顶上"""
+
+    FALLBACK_MAX_TILES = 64
+    """顶替一个图块最多用多少个别的层级的图块，层级差太多的就不用了"""
+
+    def __init__(self, capacity: int = 256, max_workers: int | None = None):
+        self.capacity = capacity
+        """最多缓存多少个图块，一个图块 256*256*4 = 256KB"""
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="tile-renderer",
+        )
+
+        self._tiles: OrderedDict[TileKey, QImage] = OrderedDict()
+        """画好的图块，越靠后越是最近用过的"""
+        self._dirty_tiles: set[TileKey] = set()
+        """场景变了、画的内容已经过期的图块，重画好之前先拿旧的顶着"""
+        self._pending: dict[TileKey, Future[QImage]] = {}
+        """正在后台绘制的图块，清空缓存时一起丢掉，已经开始画的画完了也不要"""
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    @property
+    def pending_count(self) -> int:
+        """还有多少个图块在后台绘制，调试信息用"""
+        return len(self._pending)
+
+    def clear(self):
+        """场景整个变了（比如打开了新文件），所有图块都作废"""
+        self._tiles.clear()
+        self._dirty_tiles.clear()
+        self._pending.clear()
+
+    def shutdown(self):
+        """窗口关闭时调用，还没开始画的图块不再画，正在画的也不等它画完"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.clear()
+
+    def damage_all(self):
+        """
+        场景变化的地方太多，说不清具体范围，所有图块都要重画
+        和clear不同，旧的图块在新的画好之前还会接着用，画面上不会出现空洞
+        """
+        self._dirty_tiles.update(self._tiles)
+        self._dirty_tiles.update(self._pending)
+
+    def damage(self, rects: list[Rectangle]):
+        """场景在这些世界坐标范围里发生了变化，所有缩放层级上和它们重叠的图块都要重画"""
+        if not rects:
+            return
+        # 缓存的图块数量有上限，逐个检查比按范围枚举图块坐标更可控
+        for key in [*self._tiles, *self._pending]:
+            tile_rect = self.get_tile_rect(key)
+            if any(tile_rect.is_collision(rect) for rect in rects):
+                self._dirty_tiles.add(key)
+
+    def _tile_range(self, rect: Rectangle, scale: float) -> tuple[int, int, int, int]:
+        """矩形覆盖的图块范围，闭区间 (x0, y0, x1, y1)"""
+        tile_world_size = self.TILE_SIZE / scale
+        return (
+            math.floor(rect.left() / tile_world_size),
+            math.floor(rect.top() / tile_world_size),
+            math.floor(rect.right() / tile_world_size),
+            math.floor(rect.bottom() / tile_world_size),
+        )
+
+    def get_tile_rect(self, key: TileKey) -> Rectangle:
+        """图块在世界坐标中的范围"""
+        scale, _, tx, ty = key
+        tile_world_size = self.TILE_SIZE / scale
+        return Rectangle(
+            NumberVector(tx * tile_world_size, ty * tile_world_size),
+            tile_world_size,
+            tile_world_size,
+        )
+
+    @classmethod
+    def get_pyramid_scale(cls, scale: float) -> float:
+        """离这个缩放比例最近的金字塔层级的缩放比例"""
+        levels = cls.PYRAMID_LEVELS_PER_OCTAVE
+        return 2 ** (round(math.log2(scale) * levels) / levels)
+
+    def _get_tile_view_rect(self, camera: Camera, key: TileKey) -> QRect:
+        """
+        图块贴到屏幕上的位置，四条边分别取整，这样相邻的图块拉伸之后也不会有缝
+        """
+        tile_rect = self.get_tile_rect(key)
+        left_top = camera.location_world2view(tile_rect.location_left_top)
+        right_bottom = camera.location_world2view(
+            tile_rect.location_left_top
+            + NumberVector(tile_rect.width, tile_rect.height)
+        )
+        left, top = round(left_top.x), round(left_top.y)
+        return QRect(
+            left, top, round(right_bottom.x) - left, round(right_bottom.y) - top
+        )
+
+    def _paint_fallback(
+        self,
+        painter: QPainter,
+        camera: Camera,
+        levels: list[tuple[float, float]],
+        key: TileKey,
+    ):
+        """这个图块还没画好，先用别的层级缓存的图块拉伸了顶上"""
+        tile_rect = self.get_tile_rect(key)
+        painter.save()
+        painter.setClipRect(
+            self._get_tile_view_rect(camera, key), Qt.ClipOperation.IntersectClip
+        )
+        for scale, device_pixel_ratio in levels:
+            x0, y0, x1, y1 = self._tile_range(tile_rect, scale)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > self.FALLBACK_MAX_TILES:
+                continue
+            for tx in range(x0, x1 + 1):
+                for ty in range(y0, y1 + 1):
+                    fallback_key = (scale, device_pixel_ratio, tx, ty)
+                    image = self._tiles.get(fallback_key)
+                    if image is not None:
+                        painter.drawImage(
+                            self._get_tile_view_rect(camera, fallback_key), image
+                        )
+        painter.restore()
+
+    def paint(
+        self,
+        painter: QPainter,
+        camera: Camera,
+        device_pixel_ratio: float,
+        get_snapshot: Callable[[], SceneSnapshot],
+        clip_rect: Rectangle | None = None,
+        is_preview: bool = False,
+    ):
+        """
+        把视野内已经画好的图块贴上去，缺少或者过期的图块交给后台去画，
+        还没画好的地方先用别的缩放层级的图块顶着
+        :param get_snapshot: 需要重画图块的时候才调用，获取当前场景的快照
+        :param clip_rect: 同NodeManager.paint
+        :param is_preview: 相机正在移动，用金字塔层级的图块拉伸代替按当前缩放比例画的图块
+        """
+        scale = camera.current_scale
+        if is_preview:
+            scale = self.get_pyramid_scale(scale)
+        level = (scale, device_pixel_ratio)
+        # 别的缩放层级还没开始画的图块已经用不上了，让出线程
+        for key, future in list(self._pending.items()):
+            if key[:2] != level and future.cancel():
+                del self._pending[key]
+        view_rect = camera.cover_world_rectangle if clip_rect is None else clip_rect
+        x0, y0, x1, y1 = self._tile_range(view_rect, scale)
+        center = camera.location
+        tile_world_size = self.TILE_SIZE / scale
+        # 顶替用的层级：同样设备像素比的其他层级里，缩放比例最接近的几个，远的先画近的盖在上面
+        fallback_levels = sorted(
+            {
+                key[:2]
+                for key in self._tiles
+                if key[1] == device_pixel_ratio and key[0] != scale
+            },
+            key=lambda other: abs(math.log2(other[0] / scale)),
+        )[: self.FALLBACK_LEVEL_COUNT][::-1]
+        missing_keys: list[TileKey] = []
+        for tx in range(x0, x1 + 1):
+            for ty in range(y0, y1 + 1):
+                key = (scale, device_pixel_ratio, tx, ty)
+                image = self._tiles.get(key)
+                if image is None:
+                    if fallback_levels:
+                        self._paint_fallback(painter, camera, fallback_levels, key)
+                elif scale == camera.current_scale:
+                    self._tiles.move_to_end(key)
+                    left_top = camera.location_world2view(
+                        NumberVector(tx * tile_world_size, ty * tile_world_size)
+                    ).integer()
+                    painter.drawImage(QPoint(int(left_top.x), int(left_top.y)), image)
+                else:
+                    self._tiles.move_to_end(key)
+                    painter.drawImage(self._get_tile_view_rect(camera, key), image)
+                if (
+                    image is None or key in self._dirty_tiles
+                ) and key not in self._pending:
+                    missing_keys.append(key)
+        if not missing_keys:
+            return
+        # 离视野中心近的先画
+        missing_keys.sort(
+            key=lambda k: (
+                ((k[2] + 0.5) * tile_world_size - center.x) ** 2
+                + ((k[3] + 0.5) * tile_world_size - center.y) ** 2
+            )
+        )
+        snapshot = get_snapshot()
+        for key in missing_keys:
+            self._dirty_tiles.discard(key)
+            self._pending[key] = self._executor.submit(
+                render_tile, snapshot, key, self.TILE_SIZE
+            )
+
+    def poll(self) -> list[Rectangle]:
+        """
+        取回后台画好的图块
+        :return: 这次画好的图块的世界坐标范围，需要重绘
+        """
+        finished_rects: list[Rectangle] = []
+        for key, future in list(self._pending.items()):
+            if not future.done():
+                continue
+            del self._pending[key]
+            try:
+                image = future.result()
+            except Exception as e:
+                log(f"绘制图块失败 {key}: {e}")
+                continue
+            self._tiles[key] = image
+            self._tiles.move_to_end(key)
+            finished_rects.append(self.get_tile_rect(key))
+        while len(self._tiles) > self.capacity:
+            old_key, _ = self._tiles.popitem(last=False)
+            self._dirty_tiles.discard(old_key)
+        return finished_rects
@@ -0,0 +1,69 @@
+"""
+节点之间的碰撞处理
+"""
+
+from collections import deque
+from typing import Callable, Collection, Iterable
+
+from project_graph.data_struct.spatial_hash import SpatialHash
+from project_graph.entity.entity_node import EntityNode
+from project_graph.settings.setting_service import SETTING_SERVICE
+
+
+class CollisionEngine:
+    """
+    碰撞引擎
+    粗检测：通过节点的空间索引，只找出外接矩形和挤压者重叠的节点作为候选
+    细检测：矩形严格重叠才算碰撞，然后复用 Entity.collide_with 的挤压策略把对方推开
+    被推开的节点又会去推它周围的节点，这个传递过程用工作队列代替递归
+    """
+
+    MAX_ITERATIONS = 1000
+    """一次碰撞处理最多发生多少次挤压，防止密集的节点群互相推来推去卡住一帧"""
+
+    def __init__(
+        self,
+        node_index: SpatialHash[EntityNode],
+        on_node_pushed: Callable[[EntityNode], None],
+    ):
+        """
+        :param node_index: 节点的空间索引，调用resolve之前挤压者的位置必须已经更新进去
+        :param on_node_pushed: 节点被推开之后的回调，用于更新索引等
+        """
+        self._node_index = node_index
+        self._on_node_pushed = on_node_pushed
+
+    def resolve(
+        self,
+        moved_nodes: Iterable[EntityNode],
+        rigid_nodes: Collection[EntityNode] = (),
+    ) -> int:
+        """
+        处理这些节点移动之后引发的碰撞
+        :param rigid_nodes: 不会被推开的节点，整体移动的一组节点传进来，
+                            组内的节点互相不挤压，被推开的节点也推不回来
+        :return: 实际发生的挤压次数
+        """
+        if not SETTING_SERVICE.is_enable_node_collision:
+            return 0
+
+        queue = deque(moved_nodes)
+        queued_nodes = set(queue)
+        iterations = 0
+        while queue:
+            pusher = queue.popleft()
+            queued_nodes.discard(pusher)
+            for node in self._node_index.query_rect(pusher.body_shape):
+                if node is pusher or node in rigid_nodes:
+                    continue
+                if not node.body_shape.is_collision(pusher.body_shape):
+                    continue
+                if iterations >= self.MAX_ITERATIONS:
+                    return iterations
+                iterations += 1
+                pusher.collide_with(node)
+                self._on_node_pushed(node)
+                if node not in queued_nodes:
+                    queued_nodes.add(node)
+                    queue.append(node)
+        return iterations
@@ -40,6 +40,18 @@ class SettingService:
         摩擦系数，越大摩擦力越大，摩擦力会使速度减慢
         """
 
+        self.lod_text_scale: float = 0.25
+        """缩放比例低于这个值时不再绘制节点文字"""
+
+        self.lod_flat_scale: float = 0.15
+        """缩放比例低于这个值时节点画成不抗锯齿的纯色矩形，连线合并成一条路径绘制"""
+
+        self.lod_block_scale: float = 0.06
+        """缩放比例低于这个值时不再逐个画节点，而是按区域画节点密度色块"""
+
+        self.tile_render_node_count: int = 5000
+        """节点数量达到这个值时，场景改为分块在后台线程里绘制，避免卡住界面"""
+
         pass
 
     def __dict__(self):
@@ -55,6 +67,10 @@ class SettingService:
             "camera_scale_exponent": self.camera_scale_exponent,
             "camera_move_amplitude": self.camera_move_amplitude,
             "camera_move_friction": self.camera_move_friction,
+            "lod_text_scale": self.lod_text_scale,
+            "lod_flat_scale": self.lod_flat_scale,
+            "lod_block_scale": self.lod_block_scale,
+            "tile_render_node_count": self.tile_render_node_count,
         }
 
     def to_json_string(self):
@@ -89,6 +105,12 @@ class SettingService:
                 self.camera_scale_exponent = settings.get("camera_scale_exponent", 1.1)
                 self.camera_move_amplitude = settings.get("camera_move_amplitude", 2)
                 self.camera_move_friction = settings.get("camera_move_friction", 0.1)
+                self.lod_text_scale = settings.get("lod_text_scale", 0.25)
+                self.lod_flat_scale = settings.get("lod_flat_scale", 0.15)
+                self.lod_block_scale = settings.get("lod_block_scale", 0.06)
+                self.tile_render_node_count = settings.get(
+                    "tile_render_node_count", 5000
+                )
 
     def save_settings(self):
         """
@@ -0,0 +1,29 @@
+"""
+字体缓存
+QFont 和 QFontMetrics 创建起来并不便宜，测量文字和绘制文字的时候都从这里取，
+不要在循环里自己 new
+"""
+
+from functools import lru_cache
+
+from PyQt5.QtGui import QFont, QFontMetrics
+
+DEFAULT_FONT_FAMILY = "Times New Roman"
+"""项目里统一使用的字体"""
+
+
+@lru_cache(maxsize=256)
+def get_font(family: str, point_size: float) -> QFont:
+    """
+    获取字体
+    返回的对象是多处共享的，不要修改它，需要改的话先拷贝一份 QFont(font)
+    """
+    font = QFont(family)
+    font.setPointSizeF(point_size)
+    return font
+
+
+@lru_cache(maxsize=256)
+def get_font_metrics(family: str, point_size: float) -> QFontMetrics:
+    """获取字体度量信息，同样是共享的"""
+    return QFontMetrics(get_font(family, point_size))
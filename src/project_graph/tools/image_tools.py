@@ -0,0 +1,28 @@
+"""
+图片缓存
+从资源路径加载图片并且缩放是很慢的，绘制图片的时候都从这里取缩放好的 QPixmap，
+每帧只需要贴一下图
+"""
+
+from functools import lru_cache
+
+from PyQt5.QtGui import QImage, QPixmap
+
+
+@lru_cache(maxsize=256)
+def get_scaled_pixmap(
+    image_path: str, width: int, height: int, device_pixel_ratio: float = 1.0
+) -> QPixmap:
+    """
+    获取缩放好的图片
+    :param width: 逻辑像素宽度
+    :param height: 逻辑像素高度
+    :param device_pixel_ratio: 设备像素比，高分屏上按物理像素缩放，保证图标清晰
+    返回的对象是多处共享的，不要修改它
+    """
+    image = QImage(image_path).scaled(
+        int(width * device_pixel_ratio), int(height * device_pixel_ratio)
+    )
+    pixmap = QPixmap.fromImage(image)
+    pixmap.setDevicePixelRatio(device_pixel_ratio)
+    return pixmap
@@ -1,4 +1,6 @@
-from PyQt5.QtGui import QFont, QFontMetrics
+from functools import lru_cache
+
+from project_graph.tools.font_tools import DEFAULT_FONT_FAMILY, get_font_metrics
 
 
 def get_width_by_file_name(file_name: str) -> int:
@@ -16,13 +18,13 @@ def get_width_by_file_name(file_name: str) -> int:
     return int(res)
 
 
+@lru_cache(maxsize=4096)
 def get_size_by_text(font_size: float, text: str) -> tuple[int, int, int]:
     """
     返回文本的宽度、高度和基线
+    测量结果会缓存下来，同样的字号和文本不会重复测量
     """
-    font = QFont("Times New Roman")
-    font.setPointSize(int(font_size))
-    font_metrics = QFontMetrics(font)
+    font_metrics = get_font_metrics(DEFAULT_FONT_FAMILY, int(font_size))
 
     # 获取文本的宽度和高度
     text_width = font_metrics.width(text)
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+# 没有显示器的环境（比如CI）里也能创建窗口和测量文字
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def q_application():
+    """测量文字大小等操作需要先有QApplication"""
+    app = QApplication.instance() or QApplication([])
+    yield app
@@ -0,0 +1,48 @@
+from project_graph.data_struct.number_vector import NumberVector
+from project_graph.node_manager import NodeManager
+
+
+def _make_data(count: int) -> dict:
+    return {
+        "nodes": [
+            {
+                "body_shape": {
+                    "type": "Rectangle",
+                    "location_left_top": [i * 150, 0],
+                    "width": 100,
+                    "height": 60,
+                },
+                "inner_text": f"node {i}",
+                "uuid": f"uuid-{i}",
+                "children": [f"uuid-{i + 1}"] if i + 1 < count else [],
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def test_add_from_dict_records_damage():
+    node_manager = NodeManager()
+    node_manager.take_damaged_rects()
+    revision = node_manager.scene_revision
+
+    node_manager.add_from_dict(_make_data(3), NumberVector(0, 0))
+
+    assert node_manager.scene_revision != revision
+    damaged_rects = node_manager.take_damaged_rects()
+    assert damaged_rects is not None
+    for node in node_manager.nodes:
+        assert any(rect.is_contain(node.body_shape) for rect in damaged_rects)
+
+
+def test_add_from_dict_bulk_repaints_everything():
+    node_manager = NodeManager()
+    node_manager.take_damaged_rects()
+    revision = node_manager.scene_revision
+
+    node_manager.add_from_dict(
+        _make_data(NodeManager.MAX_DAMAGED_RECTS + 1), NumberVector(0, 0)
+    )
+
+    assert node_manager.scene_revision != revision
+    assert node_manager.take_damaged_rects() is None